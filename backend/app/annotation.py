@@ -0,0 +1,185 @@
+"""Sentence splitting and entity annotation for /api/eventprocess.
+
+Only the parts of the spaCy pipeline the annotation uses are loaded: NER, plus a rule
+based sentencizer instead of the dependency parser. Concurrent requests are collected
+into micro-batches and run through nlp.pipe off the event loop. Batches with a lot of
+text are cut at sentence boundaries and spread over a process pool, so throughput
+grows with cores rather than with HTTP workers.
+
+    ANNOTATION_BATCH_SIZE       texts per nlp.pipe batch
+    ANNOTATION_BATCH_WAIT_MS    how long a batch waits for more requests to join it
+    ANNOTATION_PROCESSES        process pool size, 0 runs everything in a thread
+    ANNOTATION_PROCESS_CHARS    batches with at least this much text go to the pool
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import spacy
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+# en_core_web_sm's ner has its own tok2vec, so the shared one goes with the tagger and parser
+EXCLUDED_COMPONENTS = ["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
+BATCH_SIZE = int(os.getenv("ANNOTATION_BATCH_SIZE", "64"))
+BATCH_WAIT = float(os.getenv("ANNOTATION_BATCH_WAIT_MS", "5")) / 1000
+PROCESSES = int(os.getenv("ANNOTATION_PROCESSES", str(min(4, os.cpu_count() or 1))))
+PROCESS_CHARS = int(os.getenv("ANNOTATION_PROCESS_CHARS", "20000"))
+CHUNK_CHARS = 5000
+
+
+def load_pipeline():
+    nlp = spacy.load(SPACY_MODEL, exclude=EXCLUDED_COMPONENTS)
+    if not nlp.has_pipe("sentencizer"):
+        nlp.add_pipe("sentencizer", first=True)
+    return nlp
+
+
+def annotate_sentence(doc, sentence):
+    """The sentence text with each entity wrapped as [LABEL]text[/LABEL]."""
+    parts = []
+    last_end = sentence.start_char
+    for ent in sentence.ents:
+        parts.append(doc.text[last_end:ent.start_char])
+        parts.append(f"[{ent.label_}]{ent.text}[/{ent.label_}]")
+        last_end = ent.end_char
+    parts.append(doc.text[last_end:sentence.end_char])
+    return "".join(parts).rstrip("\n")
+
+
+def annotate_docs(nlp, texts):
+    """(sentence text, annotated text) pairs for each text."""
+    return [
+        [(sentence.text, annotate_sentence(doc, sentence)) for sentence in doc.sents]
+        for doc in nlp.pipe(texts, batch_size=BATCH_SIZE)
+    ]
+
+
+def split_text(nlp, text, max_chars=CHUNK_CHARS):
+    """Cut at the sentence starts the sentencizer finds in the whole text into chunks of
+    roughly max_chars, so the chunks yield the same sentences as the whole text. Entities
+    within a few tokens of a cut can still come out differently, NER sees less context there."""
+    doc = nlp.get_pipe("sentencizer")(nlp.make_doc(text))
+    starts = [sentence.start_char for sentence in doc.sents][1:]
+    chunks = []
+    start = 0
+    for i, cut in enumerate(starts):
+        next_cut = starts[i + 1] if i + 1 < len(starts) else len(text)
+        if next_cut - start > max_chars and cut > start:
+            chunks.append(text[start:cut])
+            start = cut
+    chunks.append(text[start:])
+    return chunks
+
+
+def split_texts(nlp, texts, max_chars=CHUNK_CHARS):
+    """(index of the text, chunk) for every chunk of every text."""
+    return [(i, chunk) for i, text in enumerate(texts) for chunk in split_text(nlp, text, max_chars)]
+
+
+_worker_nlp = None
+
+
+def _init_worker():
+    global _worker_nlp
+    _worker_nlp = load_pipeline()
+
+
+def _annotate_in_worker(texts):
+    return annotate_docs(_worker_nlp, texts)
+
+
+class AnnotationEngine:
+    def __init__(self, batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT, processes=PROCESSES, process_chars=PROCESS_CHARS):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.processes = processes
+        self.process_chars = process_chars
+        self._nlp = None
+        self._nlp_lock = asyncio.Lock()
+        self.pool = None
+        self.queue = None
+        self.task = None
+        self.stats = {"texts": 0, "batches": 0, "pool_batches": 0}
+
+    async def nlp(self):
+        # spacy.load takes seconds, it must not stall the event loop on the first request
+        async with self._nlp_lock:
+            if self._nlp is None:
+                self._nlp = await asyncio.to_thread(load_pipeline)
+        return self._nlp
+
+    async def annotate(self, text):
+        """Sentences of `text` as (sentence text, annotated text) pairs."""
+        if self.task is None or self.task.done():
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self._batch_loop())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                results = await self.run([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def run(self, texts):
+        self.stats["texts"] += len(texts)
+        self.stats["batches"] += 1
+        if self.processes > 0 and sum(len(text) for text in texts) >= self.process_chars:
+            return await self._run_in_pool(texts)
+        return await asyncio.to_thread(annotate_docs, await self.nlp(), texts)
+
+    async def _run_in_pool(self, texts):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.processes, initializer=_init_worker)
+        self.stats["pool_batches"] += 1
+        chunks = await asyncio.to_thread(split_texts, await self.nlp(), texts)
+        # one task per worker keeps the pipe batching inside each process
+        groups = [list(range(start, len(chunks), self.processes)) for start in range(self.processes)]
+        groups = [group for group in groups if group]
+        loop = asyncio.get_running_loop()
+        group_results = await asyncio.gather(*[
+            loop.run_in_executor(self.pool, _annotate_in_worker, [chunks[j][1] for j in group])
+            for group in groups
+        ])
+        annotated = [None] * len(chunks)
+        for group, results in zip(groups, group_results):
+            for j, sentences in zip(group, results):
+                annotated[j] = sentences
+        merged = [[] for _ in texts]
+        for (i, _), sentences in zip(chunks, annotated):
+            merged[i].extend(sentences)
+        return merged
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+annotation_engine = AnnotationEngine()
@@ -0,0 +1,817 @@
+"""The app's queries, for code running on the event loop.
+
+They run on SQLAlchemy's async engine over asyncpg, so a slow query only suspends the
+request waiting on it instead of blocking the worker, and each row comes back as a dict.
+app.database only keeps the sync engine that init_db and the migrations use.
+
+    ASYNC_DB_URI    defaults to DB_URI with the driver switched to asyncpg
+
+Pool sizing, pre-ping and the statement timeout are described in app.db_pool.
+"""
+import json
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import insert, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models import Event, GeneratedStory, Sessions
+from app import db_pool
+
+
+load_dotenv()
+ASYNC_DB_URI = os.getenv("ASYNC_DB_URI") or make_url(os.getenv("DB_URI")).set(drivername="postgresql+asyncpg")
+POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("ASYNC_DB_POOL_TIMEOUT", "30"))
+# rows per multi-row INSERT in create_events
+EVENT_INSERT_CHUNK = int(os.getenv("EVENT_INSERT_CHUNK", "500"))
+
+engine = create_async_engine(
+    ASYNC_DB_URI,
+    poolclass=db_pool.TimedAsyncAdaptedQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_pre_ping=db_pool.POOL_PRE_PING,
+    connect_args={"server_settings": {"statement_timeout": str(db_pool.STATEMENT_TIMEOUT_MS)}},
+)
+db_pool.register("async", engine)
+AsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+async def dispose():
+    await engine.dispose()
+
+
+def _one(result):
+    row = result.mappings().first()
+    return dict(row) if row is not None else None
+
+
+def _all(result):
+    return [dict(row) for row in result.mappings().all()]
+
+
+async def insert_user(user_data):
+    query = """
+    INSERT INTO Users (display_name, birth_date, birth_location, primary_residence, current_location,
+                       college, educational_level, parental_income, primary_interest,
+                       profession, religion, race)
+    VALUES (:display_name, :birth_date, :birth_location, :primary_residence, :current_location,
+            :college, :educational_level, :parental_income, :primary_interest,
+            :profession, :religion, :race)
+    RETURNING *;
+    """
+    columns = ["display_name", "birth_date", "birth_location", "primary_residence", "current_location", "college",
+               "educational_level", "parental_income", "primary_interest", "profession", "religion", "race"]
+    async with engine.begin() as conn:
+        user = _one(await conn.execute(text(query), {column: user_data[column] for column in columns}))
+    return user
+
+async def update_user(user_data):
+    query = """
+    UPDATE Users SET
+        display_name = :display_name,
+        birth_date = :birth_date,
+        birth_location = :birth_location,
+        primary_residence = :primary_residence,
+        current_location = :current_location,
+        college = :college,
+        educational_level = :educational_level,
+        parental_income = :parental_income,
+        primary_interest = :primary_interest,
+        profession = :profession,
+        religion = :religion,
+        race = :race
+    WHERE user_id = :user_id
+    RETURNING *;
+    """
+    columns = ["display_name", "birth_date", "birth_location", "primary_residence", "current_location", "college",
+               "educational_level", "parental_income", "primary_interest", "profession", "religion", "race", "user_id"]
+    try:
+        async with engine.begin() as conn:
+            updated_user = _one(await conn.execute(text(query), {column: user_data.get(column) for column in columns}))
+        return updated_user
+    except Exception as e:
+        print(f"Error updating user: {e}")
+        return None
+
+async def insert_friend(user_id_left, user_id_right):
+    query = """
+    INSERT INTO Friends (user_id_left, user_id_right)
+    VALUES (:user_id_left, :user_id_right)
+    ON CONFLICT DO NOTHING
+    RETURNING *;
+    """
+    async with engine.begin() as conn:
+        friend = _one(await conn.execute(text(query), {
+            "user_id_left": min(user_id_left, user_id_right), "user_id_right": max(user_id_left, user_id_right)
+        }))
+
+    if not friend:
+        raise Exception("Friend relationship already exists or invalid user IDs.")
+
+    return friend
+
+
+async def get_events_by_story_ids(story_ids: list[int]):
+    query = "SELECT * FROM Events WHERE story_id = ANY(:story_ids);"
+    async with engine.connect() as conn:
+        events = _all(await conn.execute(text(query), {"story_ids": list(story_ids)}))
+    return events
+
+
+async def get_user_events(user_id, story_ids=None):
+    query = "SELECT * FROM Events WHERE user_id = :user_id"
+    params = {"user_id": user_id}
+    if story_ids is not None:
+        query += " AND story_id = ANY(:story_ids)"
+        params["story_ids"] = list(story_ids)
+    query += " ORDER BY event_id;"
+    async with engine.connect() as conn:
+        events = _all(await conn.execute(text(query), params))
+    return events
+
+
+async def set_event_coordinates(coordinates):
+    """coordinates: (event_id, [x, y, z]) pairs"""
+    query = "UPDATE Events SET coordinates = :coordinates WHERE event_id = :event_id;"
+    if not coordinates:
+        return
+    async with engine.begin() as conn:
+        await conn.execute(text(query), [
+            {"event_id": event_id, "coordinates": point} for event_id, point in coordinates
+        ])
+
+
+async def create_events(events, embeddings=None, embedding_model=None, chunk_size=EVENT_INSERT_CHUNK):
+    """Insert many events in one transaction and return the rows in input order."""
+    if not events:
+        return []
+    embeddings = embeddings or [None] * len(events)
+    rows = [
+        {"user_id": event.user_id, "story_id": event.story_id, "text": event.text, "annotated_text": event.annotated_text,
+         "event_type": event.event_type, "event_date": event.event_date, "embedding": embedding, "embedding_model": embedding_model}
+        for event, embedding in zip(events, embeddings)
+    ]
+    query = (
+        insert(Event.__table__)
+        .returning(*Event.__table__.c, sort_by_parameter_order=True)
+        .execution_options(insertmanyvalues_page_size=chunk_size)
+    )
+    async with engine.begin() as conn:
+        created = _all(await conn.execute(query, rows))
+    return created
+
+
+async def set_event_embeddings(embeddings):
+    """embeddings: (event_id, float32 bytes, model) rows"""
+    query = "UPDATE Events SET embedding = :embedding, embedding_model = :embedding_model WHERE event_id = :event_id;"
+    if not embeddings:
+        return
+    async with engine.begin() as conn:
+        await conn.execute(text(query), [
+            {"event_id": event_id, "embedding": embedding, "embedding_model": model}
+            for event_id, embedding, model in embeddings
+        ])
+
+
+async def get_events_missing_embeddings(model, after_id, limit):
+    query = """
+    SELECT event_id, text, embedding_model FROM Events
+    WHERE event_id > :after_id AND (embedding IS NULL OR embedding_model IS DISTINCT FROM :model)
+    ORDER BY event_id
+    LIMIT :limit;
+    """
+    async with engine.connect() as conn:
+        events = _all(await conn.execute(text(query), {"after_id": after_id, "model": model, "limit": limit}))
+    return events
+
+
+async def get_event_layout(user_id):
+    query = "SELECT * FROM Event_Layouts WHERE user_id = :user_id;"
+    async with engine.connect() as conn:
+        layout = _one(await conn.execute(text(query), {"user_id": user_id}))
+    return layout
+
+
+async def save_event_layout(user_id, method, model, coordinates):
+    """Store a refit layout: the projection model and the coordinates of every event, in one transaction."""
+    layout_query = """
+    INSERT INTO Event_Layouts (user_id, method, model, event_count)
+    VALUES (:user_id, :method, :model, :event_count)
+    ON CONFLICT (user_id) DO UPDATE
+    SET method = EXCLUDED.method, model = EXCLUDED.model, event_count = EXCLUDED.event_count, fitted_at = CURRENT_TIMESTAMP;
+    """
+    coordinates_query = "UPDATE Events SET coordinates = :coordinates WHERE event_id = :event_id;"
+    async with engine.begin() as conn:
+        await conn.execute(text(layout_query), {
+            "user_id": user_id, "method": method, "model": model or None, "event_count": len(coordinates)
+        })
+        if coordinates:
+            await conn.execute(text(coordinates_query), [
+                {"event_id": event_id, "coordinates": point} for event_id, point in coordinates
+            ])
+
+
+async def get_event_type_centroids(model):
+    query = "SELECT event_type, centroid FROM Event_Type_Centroids WHERE model = :model ORDER BY event_type;"
+    async with engine.connect() as conn:
+        centroids = _all(await conn.execute(text(query), {"model": model}))
+    return centroids
+
+
+async def save_event_type_centroids(model, centroids):
+    """Replace the centroids of `model` with (event_type, centroid bytes, example_count) rows."""
+    insert_query = """
+    INSERT INTO Event_Type_Centroids (model, event_type, centroid, example_count)
+    VALUES (:model, :event_type, :centroid, :example_count);
+    """
+    rows = [
+        {"model": model, "event_type": event_type, "centroid": centroid, "example_count": example_count}
+        for event_type, centroid, example_count in centroids
+    ]
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM Event_Type_Centroids WHERE model = :model;"), {"model": model})
+        if rows:
+            await conn.execute(text(insert_query), rows)
+
+
+async def get_user_by_id(user_id):
+    query = """
+    SELECT * FROM Users WHERE user_id = :user_id;
+    """
+    async with engine.connect() as conn:
+        user = _one(await conn.execute(text(query), {"user_id": user_id}))
+    return user
+
+async def create_event(event, embedding=None, embedding_model=None):
+    query = """
+    INSERT INTO Events (user_id, story_id, text, annotated_text ,event_type, event_date, embedding, embedding_model)
+    VALUES (:user_id, :story_id, :text, :annotated_text, :event_type, :event_date, :embedding, :embedding_model)
+    RETURNING *;
+    """
+    async with engine.begin() as conn:
+        event = _one(await conn.execute(text(query), {
+            "user_id": event.user_id, "story_id": event.story_id, "text": event.text, "annotated_text": event.annotated_text,
+            "event_type": event.event_type, "event_date": event.event_date, "embedding": embedding, "embedding_model": embedding_model
+        }))
+    return event
+
+
+
+async def get_random_users(exclude_ids, limit =5):
+    query = """
+    SELECT * FROM Users
+    WHERE user_id <> ALL(:exclude_ids)
+    ORDER BY RANDOM() LIMIT :limit;
+    """
+    async with engine.connect() as conn:
+        random_users = _all(await conn.execute(text(query), {"exclude_ids": list(exclude_ids), "limit": limit}))
+    return random_users
+
+async def get_user_friends(user_id):
+    query = """
+    SELECT Users.* FROM Users
+    INNER JOIN Friends ON (Users.user_id = Friends.user_id_left AND Friends.user_id_right = :user_id)
+                        OR (Users.user_id = Friends.user_id_right AND Friends.user_id_left = :user_id);
+    """
+    async with engine.connect() as conn:
+        friends = _all(await conn.execute(text(query), {"user_id": user_id}))
+
+    return friends
+
+async def delete_user(user_id):
+    query = """
+    DELETE FROM Users WHERE user_id = :user_id;
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(query), {"user_id": user_id})
+
+
+async def insert_order(amount):
+    query = """
+    INSERT INTO Orders (amount)
+    VALUES (:amount)
+    RETURNING *;
+    """
+    async with engine.begin() as conn:
+        order = _one(await conn.execute(text(query), {"amount": amount}))
+    return order
+
+
+async def check_order_exists(order_id):
+    query = """
+    SELECT * FROM Orders WHERE order_id = :order_id;
+    """
+    async with engine.connect() as conn:
+        order = _one(await conn.execute(text(query), {"order_id": order_id}))
+    return order is not None
+
+
+
+async def create_session_for_order():
+    query = """
+    INSERT INTO Sessions (timestamp)
+    VALUES (CURRENT_TIMESTAMP)
+    RETURNING session_id;
+    """
+    async with engine.begin() as conn:
+        session_id = (await conn.execute(text(query))).scalar_one()
+    return session_id
+
+
+async def create_completed_payment(user_id, order_id, session_id):
+    query = """
+    INSERT INTO Completed_Payments (user_id, order_id, session_id)
+    VALUES (:user_id, :order_id, :session_id)
+    RETURNING *;
+    """
+    async with engine.begin() as conn:
+        completed_payment = _one(await conn.execute(text(query), {
+            "user_id": user_id, "order_id": order_id, "session_id": session_id
+        }))
+    return completed_payment
+
+async def record_payment(user_id, order_id):
+    if not await check_order_exists(order_id):
+        raise Exception("Order not found.")
+
+    session_id = await create_session_for_order()
+
+    completed_payment = await create_completed_payment(user_id, order_id, session_id)
+
+    return completed_payment
+
+
+
+async def get_user_historical_sessions(user_id):
+    query = """
+    SELECT *
+    FROM Users, Completed_Payments, Sessions, Initiated_Transactions, Generated_Stories, Display_Stories
+    WHERE Users.user_id = :user_id
+    AND Completed_Payments.user_id = Users.user_id
+    AND Completed_Payments.session_id = Sessions.session_id
+    AND Initiated_Transactions.session_id = Completed_Payments.session_id
+    AND Generated_Stories.story_id = Display_Stories.story_id
+    AND Generated_Stories.transaction_id = Initiated_Transactions.transaction_id;
+    """
+    async with engine.connect() as conn:
+        history = _all(await conn.execute(text(query), {"user_id": user_id}))
+    return history
+
+
+async def record_APICall(transaction_id, session_id, prompt):
+    record_transaction_query = """
+    INSERT INTO Initiated_Transactions (transaction_id, session_id, type)
+    VALUES (:transaction_id, :session_id, 'api_call');
+    """
+    record_API_call_query = """
+    INSERT INTO API_Calls (transaction_id, prompt)
+    VALUES (:transaction_id, :prompt);
+    """
+    # asyncpg does not adapt uuid.UUID to the varchar key the way psycopg2 does
+    params = {"transaction_id": str(transaction_id), "session_id": session_id, "prompt": prompt}
+    async with engine.begin() as conn:
+        await conn.execute(text(record_transaction_query), params)
+        await conn.execute(text(record_API_call_query), params)
+    return transaction_id
+
+async def record_sbert_call(transaction_id, session_id, corpus):
+
+    record_transaction_query = """
+    INSERT INTO Initiated_Transactions (transaction_id, session_id, type)
+    VALUES (:transaction_id, :session_id, 'sbert_call');
+    """
+    record_sbert_call_query = """
+    INSERT INTO SBERT_Calls (transaction_id, corpus)
+    VALUES (:transaction_id, :corpus);
+    """
+    params = {"transaction_id": str(transaction_id), "session_id": session_id, "corpus": corpus}
+    async with engine.begin() as conn:
+        await conn.execute(text(record_transaction_query), params)
+        await conn.execute(text(record_sbert_call_query), params)
+    return transaction_id
+
+async def insert_past_story(transaction_id, generated_story_text):
+    generated_story_query = """
+    INSERT INTO Generated_Stories (transaction_id, generated_story_text, type)
+    VALUES (:transaction_id, :generated_story_text, 'past_story')
+    RETURNING *;
+    """
+    past_story_query = """
+    INSERT INTO Past_Stories (story_id)
+    VALUES (:story_id)
+    RETURNING *;
+    """
+    async with engine.begin() as conn:
+        generated_story = _one(await conn.execute(text(generated_story_query), {
+            "transaction_id": str(transaction_id), "generated_story_text": generated_story_text
+        }))
+        past_story = _one(await conn.execute(text(past_story_query), {"story_id": generated_story["story_id"]}))
+    return past_story
+
+async def insert_future_story(transaction_id, generated_story_text, wiki_pages_titles ):
+    generated_story_query = """
+    INSERT INTO Generated_Stories (transaction_id, generated_story_text, type)
+    VALUES (:transaction_id, :generated_story_text, 'future_story')
+    RETURNING *;
+    """
+    future_story_query = """
+    INSERT INTO Future_Stories (story_id,wiki_pages)
+    VALUES (:story_id, :wiki_pages);
+    """
+    get_story_query = """
+    SELECT * FROM Generated_Stories, Future_Stories
+    WHERE Future_Stories.story_id = :story_id
+    AND Generated_Stories.story_id = Future_Stories.story_id;
+    """
+    async with engine.begin() as conn:
+        generated_story = _one(await conn.execute(text(generated_story_query), {
+            "transaction_id": str(transaction_id), "generated_story_text": generated_story_text
+        }))
+        story_id = generated_story["story_id"]
+        await conn.execute(text(future_story_query), {"story_id": story_id, "wiki_pages": list(wiki_pages_titles)})
+        future_story = _one(await conn.execute(text(get_story_query), {"story_id": story_id}))
+    return future_story
+
+async def get_all_stories_by_user_id(user_id):
+    query = """
+    SELECT *
+    FROM Generated_Stories, Initiated_Transactions, Completed_Payments
+    WHERE Initiated_Transactions.transaction_id = Generated_Stories.transaction_id
+    AND Completed_Payments.session_id = Initiated_Transactions.session_id
+    AND Completed_Payments.user_id = :user_id;
+    """
+    async with engine.connect() as conn:
+        stories = _all(await conn.execute(text(query), {"user_id": user_id}))
+    return stories
+
+async def get_future_story(story_id):
+    query = """
+    SELECT *
+    FROM Display_Stories, Generated_Stories
+    WHERE Display_Stories.story_id = Generated_Stories.story_id
+    AND Display_Stories.story_id = :story_id;
+    """
+    async with engine.connect() as conn:
+        future_story = _one(await conn.execute(text(query), {"story_id": story_id}))
+    return future_story
+
+
+async def record_identified_relationships(story_id, wiki_reference_ids,similarity_scores):
+    query = """
+    INSERT INTO Identified (story_id, wiki_reference_id, similarity)
+    VALUES (:story_id, :wiki_reference_id, :similarity)
+    RETURNING *;
+    """
+    identified_relationships = []
+    async with engine.begin() as conn:
+        for r,s in zip(wiki_reference_ids,similarity_scores):
+            identified_relationships.append(_one(await conn.execute(text(query), {
+                "story_id": story_id, "wiki_reference_id": r, "similarity": s
+            })))
+    return identified_relationships
+
+
+async def record_past_story(transaction_id, session_id, corpus, generated_story_text, references):
+    """Store a finished past story in one transaction: the sbert call, the story and its
+    identified references, as (wiki_reference_id, text_corpus, url, title, similarity) rows.
+    A failure leaves nothing behind, so the generation can simply run again."""
+    transaction_query = """
+    INSERT INTO Initiated_Transactions (transaction_id, session_id, type)
+    VALUES (:transaction_id, :session_id, 'sbert_call');
+    """
+    sbert_call_query = """
+    INSERT INTO SBERT_Calls (transaction_id, corpus)
+    VALUES (:transaction_id, :corpus);
+    """
+    generated_story_query = """
+    INSERT INTO Generated_Stories (transaction_id, generated_story_text, type)
+    VALUES (:transaction_id, :generated_story_text, 'past_story')
+    RETURNING story_id;
+    """
+    past_story_query = """
+    INSERT INTO Past_Stories (story_id)
+    VALUES (:story_id);
+    """
+    wiki_reference_query = """
+    INSERT INTO Wiki_References (wiki_reference_id, text_corpus, url, title, is_person)
+    VALUES (:wiki_reference_id, :text_corpus, :url, :title, TRUE)
+    ON CONFLICT (wiki_reference_id) DO UPDATE SET is_person = COALESCE(EXCLUDED.is_person, wiki_references.is_person);
+    """
+    identified_query = """
+    INSERT INTO Identified (story_id, wiki_reference_id, similarity)
+    VALUES (:story_id, :wiki_reference_id, :similarity);
+    """
+    params = {"transaction_id": str(transaction_id), "session_id": session_id, "corpus": corpus,
+              "generated_story_text": generated_story_text}
+    async with engine.begin() as conn:
+        await conn.execute(text(transaction_query), params)
+        await conn.execute(text(sbert_call_query), params)
+        story_id = (await conn.execute(text(generated_story_query), params)).scalar_one()
+        await conn.execute(text(past_story_query), {"story_id": story_id})
+        if references:
+            await conn.execute(text(wiki_reference_query), [
+                {"wiki_reference_id": r, "text_corpus": t, "url": u, "title": title} for r, t, u, title, _ in references
+            ])
+            await conn.execute(text(identified_query), [
+                {"story_id": story_id, "wiki_reference_id": r, "similarity": similarity} for r, _, _, _, similarity in references
+            ])
+    return {"story_id": story_id, "transaction_id": str(transaction_id), "generated_story_text": generated_story_text}
+
+
+def _check_payment(session, user_id, session_id, order_id):
+    query = """
+    SELECT Sessions.session_id
+    FROM Completed_Payments, Sessions
+    WHERE Sessions.session_id = Completed_Payments.session_id
+    AND Completed_Payments.user_id = :user_id
+    AND Completed_Payments.session_id = :session_id
+    AND Completed_Payments.order_id = :order_id;
+    """
+    result = session.execute(text(query), {'user_id': user_id, 'session_id': session_id, 'order_id': order_id}).fetchone()
+    if not result:
+        return None, None
+    # is_complete walks lazy relationships, which only load inside run_sync
+    lack = session.get(Sessions, result[0]).is_complete()
+    return True, lack
+
+async def check_payment(user_id, session_id, order_id, session=None):
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await check_payment(user_id, session_id, order_id, session)
+    async with session.begin():
+        return await session.run_sync(_check_payment, user_id, session_id, order_id)
+
+async def get_past_story_by_session_id(session_id):
+    query = """
+        SELECT *
+        FROM Past_Stories, Generated_Stories, Initiated_Transactions
+        WHERE Generated_Stories.story_id = Past_Stories.story_id
+        AND Generated_Stories.transaction_id = Initiated_Transactions.transaction_id
+        AND Initiated_Transactions.session_id = :session_id;
+    """
+    async with engine.connect() as conn:
+        past_story = _one(await conn.execute(text(query), {"session_id": session_id}))
+    return past_story
+
+
+async def get_story_by_story_id(story_id):
+    query = """
+    SELECT * FROM  Generated_Stories
+    WHERE Generated_Stories.story_id = :story_id;
+    """
+    async with engine.connect() as conn:
+        story = _one(await conn.execute(text(query), {"story_id": story_id}))
+    return story
+
+
+async def get_future_story_by_session_id(session_id):
+    query = """
+        SELECT *
+        FROM Future_Stories, Generated_Stories, Initiated_Transactions
+        WHERE Future_Stories.story_id = Generated_Stories.story_id
+        AND Generated_Stories.transaction_id = Initiated_Transactions.transaction_id
+        AND Initiated_Transactions.session_id = :session_id;
+    """
+    async with engine.connect() as conn:
+        story = _one(await conn.execute(text(query), {"session_id": session_id}))
+    return story
+
+async def get_identified_references_by_future_story_id(future_story_id):
+    query = """
+    SELECT *
+    FROM  Generated_Stories, Identified, Wiki_References
+    WHERE Identified.story_id = Generated_Stories.story_id
+    AND Wiki_References.wiki_reference_id = Identified.wiki_reference_id
+    AND Generated_Stories.story_id = :story_id;
+    """
+    async with engine.connect() as conn:
+        references = _all(await conn.execute(text(query), {"story_id": future_story_id}))
+    return references
+
+async def get_identified_references_by_session_id(session_id):
+    query ="""
+    SELECT DISTINCT Wiki_References.*
+    FROM  Initiated_Transactions, Generated_Stories, Identified, Wiki_References
+    WHERE Initiated_Transactions.transaction_id = Generated_Stories.transaction_id
+    AND Identified.story_id = Generated_Stories.story_id
+    AND Wiki_References.wiki_reference_id = Identified.wiki_reference_id
+    AND Initiated_Transactions.session_id = :session_id;
+    """
+    async with engine.connect() as conn:
+        identified_references = _all(await conn.execute(text(query), {"session_id": session_id}))
+    return identified_references
+
+async def get_past_story(story_id):
+    query = """
+    SELECT
+        ts.story_id,
+        gs.transaction_id,
+        gs.generated_story_text
+    FROM Past_Stories ts, Generated_Stories gs
+    WHERE ts.story_id = gs.story_id
+    AND ts.story_id = :story_id;
+    """
+    async with engine.connect() as conn:
+        past_story = _one(await conn.execute(text(query), {"story_id": story_id}))
+    return past_story
+
+async def get_random_wiki_references(n):
+    query = """
+    SELECT * FROM Wiki_References ORDER BY RANDOM() LIMIT :n;
+    """
+    async with engine.connect() as conn:
+        wiki_references = _all(await conn.execute(text(query), {"n": n}))
+    return wiki_references
+
+async def get_wiki_reference_titles():
+    query = """
+    SELECT DISTINCT title FROM Wiki_References;
+    """
+    async with engine.connect() as conn:
+        titles = list((await conn.execute(text(query))).scalars().all())
+    return titles
+
+async def insert_wiki_reference(wiki_reference_id, text_corpus, url, title, is_person=None):
+    query = """
+    INSERT INTO wiki_references (wiki_reference_id, text_corpus, url, title, is_person)
+    VALUES (:wiki_reference_id, :text_corpus, :url, :title, :is_person)
+    ON CONFLICT (wiki_reference_id) DO UPDATE SET is_person = COALESCE(EXCLUDED.is_person, wiki_references.is_person)
+    RETURNING *;
+    """
+    async with engine.begin() as conn:
+        wiki_reference = _one(await conn.execute(text(query), {
+            "wiki_reference_id": wiki_reference_id, "text_corpus": text_corpus, "url": url, "title": title, "is_person": is_person
+        }))
+    return wiki_reference
+
+async def set_wiki_reference_person_flags(flags):
+    query = "UPDATE Wiki_References SET is_person = :is_person WHERE wiki_reference_id = :wiki_reference_id;"
+    if not flags:
+        return
+    async with engine.begin() as conn:
+        await conn.execute(text(query), [
+            {"wiki_reference_id": wiki_reference_id, "is_person": is_person} for wiki_reference_id, is_person in flags
+        ])
+
+
+async def get_cached_embeddings(model, text_hashes, touch_after_seconds):
+    # last_used_at keeps the size-based eviction least-recently-used, it is only rewritten once
+    # it is `touch_after_seconds` old so a hot row is not updated on every read
+    query = """
+    WITH hits AS (
+        SELECT text_hash, embedding, last_used_at FROM Embedding_Cache
+        WHERE model = :model AND text_hash = ANY(:text_hashes)
+    ), touched AS (
+        UPDATE Embedding_Cache SET last_used_at = CURRENT_TIMESTAMP
+        WHERE model = :model AND text_hash IN (
+            SELECT text_hash FROM hits
+            WHERE last_used_at < CURRENT_TIMESTAMP - make_interval(secs => :touch_after_seconds)
+        )
+    )
+    SELECT text_hash, embedding FROM hits;
+    """
+    async with engine.begin() as conn:
+        rows = _all(await conn.execute(text(query), {
+            "model": model, "text_hashes": list(text_hashes), "touch_after_seconds": float(touch_after_seconds)
+        }))
+    return rows
+
+async def insert_cached_embeddings(rows):
+    query = """
+    INSERT INTO Embedding_Cache (model, text_hash, embedding)
+    VALUES (:model, :text_hash, :embedding)
+    ON CONFLICT (model, text_hash) DO NOTHING;
+    """
+    if not rows:
+        return
+    async with engine.begin() as conn:
+        await conn.execute(text(query), [{"model": m, "text_hash": h, "embedding": e} for m, h, e in rows])
+
+async def evict_cached_embeddings(max_entries):
+    # the planner's row estimate is enough to tell whether the table outgrew its limit,
+    # -1 means the table was never analyzed
+    count_query = """
+    SELECT reltuples FROM pg_class WHERE oid = 'embedding_cache'::regclass;
+    """
+    evict_query = """
+    DELETE FROM Embedding_Cache WHERE (model, text_hash) IN (
+        SELECT model, text_hash FROM Embedding_Cache
+        ORDER BY last_used_at DESC
+        OFFSET :max_entries
+    );
+    """
+    async with engine.begin() as conn:
+        estimate = (await conn.execute(text(count_query))).scalar_one()
+        if 0 <= estimate <= max_entries:
+            return 0
+        evicted = (await conn.execute(text(evict_query), {"max_entries": max_entries})).rowcount
+    return evicted
+
+
+async def get_cached_past_story(profile_hash, max_age_seconds):
+    query = """
+    SELECT generated_story_text FROM Past_Story_Cache
+    WHERE profile_hash = :profile_hash
+    AND created_at > CURRENT_TIMESTAMP - make_interval(secs => :max_age_seconds);
+    """
+    async with engine.connect() as conn:
+        story_text = (await conn.execute(text(query), {
+            "profile_hash": profile_hash, "max_age_seconds": float(max_age_seconds)
+        })).scalar_one_or_none()
+    return story_text
+
+async def insert_cached_past_story(profile_hash, prompt_version, generated_story_text):
+    query = """
+    INSERT INTO Past_Story_Cache (profile_hash, prompt_version, generated_story_text)
+    VALUES (:profile_hash, :prompt_version, :generated_story_text)
+    ON CONFLICT (profile_hash) DO UPDATE
+    SET generated_story_text = EXCLUDED.generated_story_text, created_at = CURRENT_TIMESTAMP;
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(query), {
+            "profile_hash": profile_hash, "prompt_version": prompt_version, "generated_story_text": generated_story_text
+        })
+
+async def create_story_job(job_id, session_id, kind, payload):
+    query = """
+    INSERT INTO Story_Jobs (job_id, session_id, kind, status, attempts, payload)
+    VALUES (:job_id, :session_id, :kind, 'queued', 0, CAST(:payload AS JSON))
+    ON CONFLICT (session_id, kind) WHERE status <> 'failed' DO NOTHING
+    RETURNING *;
+    """
+    async with engine.begin() as conn:
+        job = _one(await conn.execute(text(query), {
+            "job_id": job_id, "session_id": session_id, "kind": kind, "payload": json.dumps(payload)
+        }))
+    return job
+
+async def get_story_job(job_id):
+    query = """
+    SELECT * FROM Story_Jobs WHERE job_id = :job_id;
+    """
+    async with engine.connect() as conn:
+        job = _one(await conn.execute(text(query), {"job_id": job_id}))
+    return job
+
+async def get_latest_story_job(session_id, kind):
+    query = """
+    SELECT * FROM Story_Jobs
+    WHERE session_id = :session_id AND kind = :kind
+    ORDER BY created_at DESC LIMIT 1;
+    """
+    async with engine.connect() as conn:
+        job = _one(await conn.execute(text(query), {"session_id": session_id, "kind": kind}))
+    return job
+
+async def claim_story_job(job_id):
+    query = """
+    UPDATE Story_Jobs SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE job_id = :job_id AND status = 'queued'
+    RETURNING *;
+    """
+    async with engine.begin() as conn:
+        job = _one(await conn.execute(text(query), {"job_id": job_id}))
+    return job
+
+async def finish_story_job(job_id, status, result, error):
+    query = """
+    UPDATE Story_Jobs SET status = :status, result = CAST(:result AS JSON), error = :error, updated_at = CURRENT_TIMESTAMP
+    WHERE job_id = :job_id;
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(query), {
+            "status": status, "result": json.dumps(result) if result is not None else None, "error": error, "job_id": job_id
+        })
+
+async def requeue_stale_story_jobs(stale_seconds):
+    # jobs left running by a process that died are handed back to the queue
+    requeue_query = """
+    UPDATE Story_Jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP
+    WHERE status = 'running' AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => :stale_seconds);
+    """
+    queued_query = """
+    SELECT job_id FROM Story_Jobs WHERE status = 'queued' ORDER BY created_at;
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(requeue_query), {"stale_seconds": float(stale_seconds)})
+        job_ids = list((await conn.execute(text(queued_query))).scalars().all())
+    return job_ids
+
+
+def _delete_story(session, story_id):
+    story = session.query(GeneratedStory).filter(GeneratedStory.story_id == story_id).first()
+    session.delete(story)
+
+async def delete_story(story_id, session=None):
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await delete_story(story_id, session)
+    # the ORM cascades take care of the sub-story, events and identified rows
+    async with session.begin():
+        await session.run_sync(_delete_story, story_id)
+    return {"message": "Story and its related sub-story, event, and identified relationships have been deleted."}
@@ -0,0 +1,57 @@
+"""Offline job that tags every vector in the wiki reference index as person / non-person.
+
+The flag is written to the vector metadata (`is_person`) and to wiki_references.is_person,
+so get_similar_stories can filter inside the query instead of checking Wikipedia
+categories on every /api/yunsuan call.
+
+    python -m app.classify_references [--force] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import logging
+
+from app import async_database, dependencies, providers
+
+logger = logging.getLogger(__name__)
+
+
+async def classify_vector(index, vector_id, metadata, semaphore):
+    async with semaphore:
+        try:
+            page = await dependencies.get_wiki_page(metadata["title"])
+        except Exception as e:
+            logger.warning("Skipping %s (%s): %s", vector_id, metadata.get("title"), e)
+            return None
+        is_person = dependencies.filter_for_human(page)
+        await asyncio.to_thread(index.update_metadata, vector_id, {"is_person": is_person})
+        return vector_id, is_person
+
+
+async def classify_index(force=False, concurrency=8, batch_size=100):
+    semaphore = asyncio.Semaphore(concurrency)
+    classified = 0
+    index = providers.vector()
+    for ids in index.list_ids(batch_size):
+        metadata = await asyncio.to_thread(index.fetch_metadata, ids)
+        pending = [
+            (vector_id, vector_metadata)
+            for vector_id, vector_metadata in metadata.items()
+            if force or "is_person" not in vector_metadata
+        ]
+        results = await asyncio.gather(*[classify_vector(index, i, m, semaphore) for i, m in pending])
+        flags = [r for r in results if r is not None]
+        if flags:
+            await async_database.set_wiki_reference_person_flags(flags)
+        classified += len(flags)
+        logger.info("Classified %d vectors", classified)
+    return classified
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", action="store_true", help="reclassify vectors that already have a flag")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    total = asyncio.run(classify_index(force=args.force, concurrency=args.concurrency))
+    print(f"Classified {total} reference vectors.")
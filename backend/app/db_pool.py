@@ -0,0 +1,73 @@
+"""Connection pool settings and checkout metrics for the sync and async engines.
+
+Both engines use a QueuePool subclass that times every checkout: waiting for a free
+connection, opening an overflow one and the pre-ping. Rising waits and timeouts in
+GET /api/metrics mean the pool is saturated before the database is.
+
+    DB_POOL_SIZE / ASYNC_DB_POOL_SIZE          connections kept open per process
+    DB_MAX_OVERFLOW / ASYNC_DB_MAX_OVERFLOW    extra connections opened under load
+    DB_POOL_TIMEOUT / ASYNC_DB_POOL_TIMEOUT    seconds to wait for a connection before failing
+    DB_POOL_PRE_PING                           test connections on checkout, drops ones the server closed
+    DB_STATEMENT_TIMEOUT_MS                    server side limit per statement, 0 disables it
+"""
+import os
+import time
+from collections import deque
+
+import numpy as np
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+WAIT_SAMPLES = 1000
+
+_engines = {}
+
+
+class TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.stats = {"checkouts": 0, "timeouts": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        finally:
+            wait_ms = (time.perf_counter() - start) * 1000
+            self.waits.append(wait_ms)
+            self.stats["checkouts"] += 1
+            self.stats["total_wait_ms"] += wait_ms
+            self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait_ms)
+
+    def snapshot(self):
+        waits = list(self.waits)
+        return {
+            **self.stats,
+            "p95_wait_ms": float(np.percentile(waits, 95)) if waits else None,
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+        }
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def register(name, engine):
+    # the engine rather than its pool, dispose() swaps the pool for a new one
+    _engines[name] = engine
+
+
+def stats():
+    return {"db_pools": {name: engine.pool.snapshot() for name, engine in _engines.items()}}
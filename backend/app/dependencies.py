@@ -1,39 +1,53 @@
-
 from fastapi.templating import Jinja2Templates
-import cohere
 import os
 import dotenv
 import json
-from pinecone.grpc import PineconeGRPC as pinecone
-from openai import OpenAI
+import asyncio
+import hashlib
+import time
 from openai import BadRequestError
-import wikipediaapi
 import logging
 import absl.logging
-import spacy
-from sklearn.manifold import TSNE
+from app import async_database, providers, resilience
+from app.embedding_cache import embedding_cache
+from app.wiki_store import WikiPageStore
+from app.singleflight import SingleFlight
+from app.reference_context import STOP_SECTIONS, build_reference_context
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'  # Suppress TF logging
 logging.getLogger('absl').setLevel(logging.ERROR)  # Suppress absl logging
 absl.logging.set_verbosity(absl.logging.ERROR)  # Suppress absl logging
 logging.root.removeHandler(absl.logging._absl_handler)  # Remove absl handler
-nlp = spacy.load("en_core_web_sm")
-tsne = TSNE(n_components=3, random_state=42, perplexity=3) #n_components is the number of dimensions to reduce to
 
 
 dotenv.load_dotenv()
-wiki = wikipediaapi.Wikipedia(user_agent="echo-project-1",language='en')
 
 
-pc = pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index(host=os.getenv("PINECONE_INDEX_HOST"))
 templates = Jinja2Templates(directory="templates")
-deepseek_ai_client = OpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"),base_url="https://api.deepseek.com")
-open_ai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+chat_flight = SingleFlight()
+embed_flight = SingleFlight()
+wiki_flight = SingleFlight()
+# only enable once app.classify_references has tagged the index, otherwise every query comes back empty
+PERSON_FILTER = os.getenv("REFERENCE_PERSON_FILTER", "0") == "1"
+# token budget for the reference pages in the tui_suan prompt, split evenly between the figures
+REFERENCE_TOKEN_BUDGET = int(os.getenv("REFERENCE_TOKEN_BUDGET", "6000"))
+# how the per-paragraph matches of one figure are merged: max, mean or rrf (reciprocal rank fusion)
+REFERENCE_FUSION = os.getenv("REFERENCE_FUSION", "max")
+REFERENCE_CANDIDATE_LIMIT = int(os.getenv("REFERENCE_CANDIDATE_LIMIT", "10"))
+RRF_K = 60
+WIKI_FETCH_CONCURRENCY = int(os.getenv("WIKI_FETCH_CONCURRENCY", "8"))
+WIKI_FETCH_TIMEOUT = float(os.getenv("WIKI_FETCH_TIMEOUT", "10"))
+# bump whenever the generate_past_story messages change so old biographies are not reused
+PAST_STORY_PROMPT_VERSION = "1"
+PAST_STORY_CACHE_TTL = float(os.getenv("PAST_STORY_CACHE_TTL_DAYS", "30")) * 24 * 3600
+past_story_cache_stats = {"hits": 0, "misses": 0, "errors": 0}
+# provider:model tried when deepseek fails or its circuit is open, empty to disable
+PAST_STORY_FALLBACK_MODEL = os.getenv("PAST_STORY_FALLBACK_MODEL", "openai:gpt-4o-mini")
+past_story_fallback_stats = {"used": 0, "failed": 0}
 
 
 
-def generate_past_story(user_str):
+async def generate_past_story(user_str):
     json_str = user_str.replace('""', '"')
     user = json.loads(json_str)    
     fields_to_include = [
@@ -45,6 +59,11 @@ def generate_past_story(user_str):
     clean_str = ", ".join(f"{field.replace('_', ' ')}: {user[field]}" 
                             for field in fields_to_include)
 
+    profile_hash = past_story_cache_key(clean_str)
+    cached_story = await get_cached_past_story(profile_hash)
+    if cached_story is not None:
+        return cached_story
+
     messages = [
     {"role": "system", "content": "You are a wikipedia writer. You are given some basic information of a person and you are asked to write a wikipedia page about them. "},
     {"role": "user", "content": "This is the basic information of the person: " + clean_str},
@@ -52,15 +71,54 @@ def generate_past_story(user_str):
     {"role": "user", "content": "Break the article into paragraphs with a maximum of 250 words per paragraph."},
     {"role": "user", "content": "With parental income, do not include the numerical income in the article. Just mention the income level."}
     ]
-    response = deepseek_ai_client.chat.completions.create(
-        model="deepseek-chat",
-        messages=messages,
-        stream=False
-    )
-    story_text = response.choices[0].message.content
+    try:
+        story_text = await chat_completion("deepseek", "deepseek-chat", messages)
+    except Exception as e:
+        if not PAST_STORY_FALLBACK_MODEL:
+            raise
+        # not cached: the profile should get a deepseek biography once it is back
+        return clean_story_text(await fallback_past_story(messages, e))
     story_text = clean_story_text(story_text)
+    await store_cached_past_story(profile_hash, story_text)
+    return story_text
+
+async def fallback_past_story(messages, error):
+    provider, model = PAST_STORY_FALLBACK_MODEL.split(":", 1)
+    logging.warning("Past story generation failed (%r), falling back to %s", error, PAST_STORY_FALLBACK_MODEL)
+    past_story_fallback_stats["used"] += 1
+    try:
+        return await chat_completion(provider, model, messages)
+    except Exception:
+        past_story_fallback_stats["failed"] += 1
+        raise
+
+def past_story_cache_key(clean_str):
+    # only whitespace is normalized, case can carry meaning in names, places and professions
+    normalized = " ".join(clean_str.split())
+    provider = providers.chat("deepseek").name
+    return hashlib.sha256(f"{PAST_STORY_PROMPT_VERSION}\0{provider}\0{normalized}".encode("utf-8")).hexdigest()
+
+async def get_cached_past_story(profile_hash):
+    if PAST_STORY_CACHE_TTL <= 0:
+        return None
+    try:
+        story_text = await async_database.get_cached_past_story(profile_hash, PAST_STORY_CACHE_TTL)
+    except Exception as e:
+        logging.warning("Past story cache lookup failed: %s", e)
+        past_story_cache_stats["errors"] += 1
+        return None
+    past_story_cache_stats["hits" if story_text is not None else "misses"] += 1
     return story_text
 
+async def store_cached_past_story(profile_hash, story_text):
+    if PAST_STORY_CACHE_TTL <= 0 or not story_text:
+        return
+    try:
+        await async_database.insert_cached_past_story(profile_hash, PAST_STORY_PROMPT_VERSION, story_text)
+    except Exception as e:
+        logging.warning("Past story cache write failed: %s", e)
+        past_story_cache_stats["errors"] += 1
+
 def clean_story_text(story_text):
     # Split into paragraphs first
     paragraphs = story_text.split('\n\n')
@@ -82,12 +140,12 @@ def clean_story_text(story_text):
     # Rejoin paragraphs with double newlines
     return '\n\n'.join(clean_paragraphs)
 
-def deepseek_check(content):
+async def deepseek_check(content):
     try:
-        response = open_ai_client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": "Check if the following content contains any sensitive information: " + content}],
-            stream=False
+        await chat_completion(
+            "deepseek",
+            "deepseek-chat",
+            [{"role": "user", "content": "Check if the following content contains any sensitive information: " + content}]
         )
     except BadRequestError as e:
         if e.code == 400 and "Content Exists Risk" in str(e):
@@ -97,77 +155,174 @@ def deepseek_check(content):
     return False
 
 
-def get_similar_stories(story_text, n):
+async def get_similar_stories(story_text, n):
     paragraphs = break_down_story(story_text)
-    embeddings = [get_embeddings(paragraph) for paragraph in paragraphs]
-    all_matches = []
-    for paragraph in embeddings:
-        response = index.query(paragraph, top_k=n,include_metadata=True)
-        all_matches.extend(response.matches)
-    return all_matches
+    embeddings = await get_embeddings_batch(paragraphs)
+    query_filter = {"is_person": {"$eq": True}} if PERSON_FILTER else None
+    responses = await asyncio.gather(*[query_index(embedding, n, query_filter) for embedding in embeddings])
+    return fuse_matches(responses, REFERENCE_FUSION, REFERENCE_CANDIDATE_LIMIT)
+
+def fuse_matches(match_lists, method="max", limit=None):
+    """Merge the top-k lists of every paragraph into one list with a single entry per
+    reference id, best first. `score` is the fused ranking score, `similarity` the best
+    raw similarity the reference reached and `hits` the number of paragraphs matching it."""
+    fused = {}
+    for matches in match_lists:
+        for rank, match in enumerate(sorted(matches, key=lambda m: m["score"], reverse=True)):
+            entry = fused.setdefault(match["id"], {"id": match["id"], "metadata": match["metadata"], "scores": [], "ranks": []})
+            entry["scores"].append(match["score"])
+            entry["ranks"].append(rank)
+
+    candidates = []
+    for entry in fused.values():
+        if method == "mean":
+            # averaged over every paragraph, so a figure only one paragraph matched is diluted
+            score = sum(entry["scores"]) / len(match_lists)
+        elif method == "rrf":
+            score = sum(1 / (RRF_K + rank + 1) for rank in entry["ranks"])
+        elif method == "max":
+            score = max(entry["scores"])
+        else:
+            raise ValueError(f"Unknown fusion method {method}")
+        candidates.append({
+            "id": entry["id"],
+            "metadata": entry["metadata"],
+            "score": score,
+            "similarity": max(entry["scores"]),
+            "hits": len(entry["scores"]),
+        })
+    candidates.sort(key=lambda c: (c["score"], c["similarity"]), reverse=True)
+    return candidates[:limit] if limit else candidates
+
+async def chat_completion(provider, model, messages):
+    key = hashlib.sha256(json.dumps([provider, model, messages], sort_keys=True).encode("utf-8")).hexdigest()
+    breaker = resilience.breaker(provider)
+    return await chat_flight.do(key, lambda: breaker.call(lambda: providers.chat(provider).complete(model, messages)))
+
+async def stream_chat_completion(provider, model, messages):
+    breaker = resilience.breaker(provider)
+    breaker.acquire()
+    started = time.monotonic()
+    first_chunk = True
+    try:
+        async for chunk in providers.chat(provider).stream(model, messages):
+            if first_chunk:
+                # a stream is as slow as the reader, so only the time to first token counts
+                breaker.on_success(time.monotonic() - started)
+                first_chunk = False
+            yield chunk
+    except Exception as e:
+        if first_chunk:
+            breaker.on_failure(e)
+        raise
+    except BaseException:
+        if first_chunk:
+            breaker.release()
+        raise
+    if first_chunk:
+        breaker.on_success(time.monotonic() - started)
+
+async def query_index(vector, top_k, query_filter=None):
+    vector_provider = providers.vector()
+    return await resilience.breaker("vector").call(
+        lambda: resilience.hedger("vector").run(lambda: vector_provider.query(vector, top_k, query_filter))
+    )
 
 def break_down_story(story_text):
-    paragraphs = story_text.split("\n")
+    paragraphs = [p for p in story_text.split("\n") if p.strip()]
     return paragraphs
     
-def get_embeddings(text):
-    co = cohere.Client(os.getenv("COHERE_API_KEY"))
-    response = co.embed(
-        texts=[text],
-        model='multilingual-22-12'
-    )
-    return response.embeddings[0]
+async def get_embeddings(text):
+    embeddings = await get_embeddings_batch([text])
+    return embeddings[0]
+
+async def get_embeddings_batch(texts):
+    if not texts:
+        return []
+    return await embedding_cache.get_many(providers.embedding().model, list(texts), embed_texts)
+
+async def embed_texts(texts):
+    # texts another request is already embedding are awaited, only the rest are sent
+    embedder = providers.embedding()
+
+    async def embed(keys):
+        batch = [text for _, text in keys]
+        return await resilience.breaker("embedding").call(
+            lambda: resilience.hedger("embedding").run(lambda: embedder.embed(batch), size=len(batch))
+        )
+
+    return await embed_flight.do_many([(embedder.model, text) for text in texts], embed)
     
 def filter_for_human(wiki_page):
-    categories = list(wiki_page.categories.keys())
-    str_categories = " ".join(categories)
+    str_categories = " ".join(wiki_page["categories"])
     if "People " in str_categories or "Person" in str_categories:
         return True
     return False
 
-def get_full_wiki_page(title):
-    page = wiki.page(title)
-    sections = get_all_sections(page.sections)
+async def get_wiki_page(title):
+    return await wiki_store.get(title)
+
+def load_wiki_page(title):
+    return providers.wiki().load_page(title)
+
+wiki_store = WikiPageStore(
+    os.getenv("WIKI_STORE_DIR", "wiki_store"),
+    loader=load_wiki_page,
+    flight=wiki_flight,
+    ttl=float(os.getenv("WIKI_STORE_TTL_DAYS", "30")) * 24 * 3600,
+)
+
+async def get_full_wiki_page(title):
+    page = await get_wiki_page(title)
+    sections = get_all_sections(page["sections"])
     full_page_text = "\n".join(sections)
     return full_page_text
 
 def get_all_sections(sections,level=0):
     result = []
     for s in sections:
-        if s.title in ["See also", "References", "External links", "Further reading", "Notes and references", "Bibliography", "Sources", "Literature", "Footnotes", "Works cited", "Citations", "Photo gallery", "Quotations", "External media", "Related topics", "Related articles", "Further reading", "References", "External links", "Further reading", "Notes and references", "Bibliography", "Sources", "Literature", "Footnotes", "Works cited", "Citations", "Photo gallery", "Quotations", "External media", "Related topics", "Related articles", "Further reading", "References", "External links", "Further reading", "Notes and references", "Bibliography", "Sources", "Literature", "Footnotes", "Works cited", "Citations", "Photo gallery", "Quotations", "External media", "Related topics", "Related articles", "Further reading"]:
+        if s["title"] in STOP_SECTIONS:
             break
-        result.append("%s: %s - %s" % ("*" * (level + 1), s.title, s.text))
-        result.extend(get_all_sections(s.sections, level + 1))
+        result.append("%s: %s - %s" % ("*" * (level + 1), s["title"], s["text"]))
+        result.extend(get_all_sections(s["sections"], level + 1))
     return result
 
-def process_wiki_references(wiki_references):
-    seen = set()
-    wiki_references_full_text = ""
-    wiki_references_titles = []
-
-    for wiki_reference in wiki_references:
-        if wiki_reference.title not in seen:
-            seen.add(wiki_reference.title)
-            full_text = get_full_wiki_page(wiki_reference.title)
-            wiki_references_full_text += "\n" + full_text
-            wiki_references_titles.append(wiki_reference.title)
-            
-            
-            
+async def process_wiki_references(wiki_references, biography):
+    titles = list(dict.fromkeys(wiki_reference.title for wiki_reference in wiki_references))
+    semaphore = asyncio.Semaphore(WIKI_FETCH_CONCURRENCY)
+
+    async def fetch(title):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(get_wiki_page(title), WIKI_FETCH_TIMEOUT)
+            except Exception as e:
+                # a slow or missing page only costs the story that one reference
+                logging.warning("Skipping wiki reference %r: %r", title, e)
+                return None
+
+    # gather keeps the input order, so titles stay in reference order whatever finishes first
+    fetched = await asyncio.gather(*[fetch(title) for title in titles])
+    pages = [page for page in fetched if page is not None]
+    wiki_references_titles = [title for title, page in zip(titles, fetched) if page is not None]
+
+    wiki_references_full_text = await build_reference_context(biography, pages, REFERENCE_TOKEN_BUDGET, get_embeddings_batch)
     return wiki_references_full_text, wiki_references_titles
 
 
 
-if __name__ == "__main__":
+async def main():
     story_text ="Born in Suzhou, China, Jiajiabinx has developed a strong interest in the intersection of artificial intelligence (AI) and art, blending technology with creative expression. Currently pursuing an MBA, Jiajiabinx is focused on exploring innovative ways to integrate AI into artistic and business practices\n\nGrowing up in a family with a modest income, Jiajiabinx developed a passion for learning and creativity from an early age. After completing secondary education, Jiajiabinx moved to the United States to attend Williams College, a prestigious liberal arts institution. At Williams, Jiajiabinx earned a Bachelor’s degree, laying the foundation for a career that combines analytical thinking with artistic exploration\n\nJiajiabinx’s primary interest lies in the intersection of AI and art, exploring how artificial intelligence can be used to enhance artistic expression and innovation. This unique blend of interests reflects Jiajiabinx’s commitment to bridging the gap between technology and creativity\n\nThe move from Suzhou to New York has allowed Jiajiabinx to immerse in a diverse cultural environment, further enriching personal and professional perspectives. Jiajiabinx continues to reside in New York, where the vibrant art and tech scenes provide ample opportunities for growth and exploration"
-    matches = get_similar_stories(story_text, 15)
-    matches =sorted(matches, key=lambda x: x["score"], reverse=True)
+    matches = await get_similar_stories(story_text, 15)
     wiki_references_ids = []
     for match in matches:
-        page = wiki.page(match["metadata"]["title"])
+        page = await get_wiki_page(match["metadata"]["title"])
         if filter_for_human(page):
-            print(page.title)
+            print(page["title"])
             print(match["score"])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
             
 
 
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from app import async_database
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Two tier cache of embeddings keyed by (model, sha256(text)).
+
+    The first tier is an in-process LRU, the second one is the embedding_cache
+    table, so vectors survive restarts and are shared between workers. The table is
+    trimmed back to `persistent_max_entries` every `evict_every` stored vectors, and a
+    row's last use is refreshed at most every `touch_after_seconds`.
+    """
+
+    def __init__(self, max_entries=10000, persistent_max_entries=500000, persistent=True,
+                 evict_every=1000, touch_after_seconds=3600):
+        self.max_entries = max_entries
+        self.persistent_max_entries = persistent_max_entries
+        self.persistent = persistent
+        self.evict_every = evict_every
+        self.touch_after_seconds = touch_after_seconds
+        self.stored_since_evict = 0
+        self.memory = OrderedDict()
+        self.stats = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "persistent_evictions": 0,
+            "persistent_errors": 0,
+        }
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    async def get_many(self, model, texts, compute):
+        """Return one vector per text, calling `compute` only for the texts not cached anywhere."""
+        hashes = [self.text_hash(text) for text in texts]
+        found = {}
+        for h in set(hashes):
+            vector = self.memory.get((model, h))
+            if vector is not None:
+                self.memory.move_to_end((model, h))
+                found[h] = vector
+        self.stats["memory_hits"] += sum(1 for h in hashes if h in found)
+
+        missing = [h for h in dict.fromkeys(hashes) if h not in found]
+        if missing and self.persistent:
+            stored = await self._load(model, missing)
+            self.stats["persistent_hits"] += sum(1 for h in hashes if h in stored)
+            for h, vector in stored.items():
+                found[h] = vector
+                self._remember(model, h, vector)
+            missing = [h for h in missing if h not in stored]
+
+        if missing:
+            missing_set = set(missing)
+            self.stats["misses"] += sum(1 for h in hashes if h in missing_set)
+            text_by_hash = dict(zip(hashes, texts))
+            computed = await compute([text_by_hash[h] for h in missing])
+            new_rows = {}
+            for h, vector in zip(missing, computed):
+                vector = np.asarray(vector, dtype=np.float32)
+                found[h] = vector
+                new_rows[h] = vector
+                self._remember(model, h, vector)
+            if self.persistent:
+                await self._store(model, new_rows)
+
+        return [found[h].tolist() for h in hashes]
+
+    def _remember(self, model, h, vector):
+        self.memory[(model, h)] = vector
+        self.memory.move_to_end((model, h))
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def _load(self, model, hashes):
+        try:
+            rows = await async_database.get_cached_embeddings(model, hashes, self.touch_after_seconds)
+        except Exception as e:
+            logger.warning("Embedding cache lookup failed: %s", e)
+            self.stats["persistent_errors"] += 1
+            return {}
+        return {row["text_hash"]: np.frombuffer(bytes(row["embedding"]), dtype=np.float32) for row in rows}
+
+    async def _store(self, model, vectors):
+        rows = [(model, h, vector.tobytes()) for h, vector in vectors.items()]
+        try:
+            await async_database.insert_cached_embeddings(rows)
+        except Exception as e:
+            logger.warning("Embedding cache write failed: %s", e)
+            self.stats["persistent_errors"] += 1
+            return
+        self.stored_since_evict += len(rows)
+        if self.stored_since_evict < self.evict_every:
+            return
+        self.stored_since_evict = 0
+        try:
+            self.stats["persistent_evictions"] += await async_database.evict_cached_embeddings(self.persistent_max_entries)
+        except Exception as e:
+            logger.warning("Embedding cache eviction failed: %s", e)
+            self.stats["persistent_errors"] += 1
+
+    def clear(self):
+        self.memory.clear()
+
+
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000")),
+    persistent_max_entries=int(os.getenv("EMBEDDING_CACHE_DB_MAX_ENTRIES", "500000")),
+    persistent=os.getenv("EMBEDDING_CACHE_PERSIST", "1") == "1",
+    evict_every=int(os.getenv("EMBEDDING_CACHE_EVICT_EVERY", "1000")),
+    touch_after_seconds=float(os.getenv("EMBEDDING_CACHE_TOUCH_SECONDS", "3600")),
+)
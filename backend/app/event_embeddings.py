@@ -0,0 +1,69 @@
+"""Embeddings stored on the events themselves, as raw float32 bytes plus the model name.
+
+Events are embedded in one batch when they are created, so the readers (the event
+layout) take the vectors straight from the rows. Rows written before the column existed,
+or by another embedding model, are embedded on first read and stored, or up front with
+
+    python -m app.event_embeddings backfill [--batch-size 256]
+"""
+import argparse
+import asyncio
+import logging
+
+import numpy as np
+
+from app import async_database, providers
+from app.dependencies import get_embeddings_batch
+
+logger = logging.getLogger(__name__)
+
+
+def encode(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def decode(data):
+    return np.frombuffer(bytes(data), dtype=np.float32)
+
+
+async def embed_events(texts):
+    """(model, float32 bytes) for each text, ready to store with the event."""
+    model = providers.embedding().model
+    embeddings = await get_embeddings_batch(texts)
+    return model, [encode(embedding) for embedding in embeddings]
+
+
+async def load_event_embeddings(events):
+    """Vectors for event rows, computing and storing only the ones missing or from another model."""
+    model = providers.embedding().model
+    stale = [event for event in events if event.get("embedding") is None or event.get("embedding_model") != model]
+    if stale:
+        _, encoded = await embed_events([event["text"] for event in stale])
+        rows = [(event["event_id"], data, model) for event, data in zip(stale, encoded)]
+        await async_database.set_event_embeddings(rows)
+        for event, data in zip(stale, encoded):
+            event["embedding"], event["embedding_model"] = data, model
+    return np.stack([decode(event["embedding"]) for event in events]) if events else np.zeros((0, 0), dtype=np.float32)
+
+
+async def backfill(batch_size=256):
+    model = providers.embedding().model
+    total = 0
+    after_id = 0
+    while True:
+        events = await async_database.get_events_missing_embeddings(model, after_id, batch_size)
+        if not events:
+            return total
+        await load_event_embeddings(events)
+        total += len(events)
+        after_id = events[-1]["event_id"]
+        logger.info("Embedded %d events", total)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+    count = asyncio.run(backfill(args.batch_size))
+    print(f"Stored embeddings for {count} events.")
@@ -0,0 +1,84 @@
+"""Persisted 3D layout of each user's events for the event visualization.
+
+Coordinates are stored on the events, so reading them back is a plain query. When new
+events arrive they are placed against the existing layout: with the user's fitted
+projection model when the engine can transform new points (see app.projection), otherwise
+at the similarity-weighted mean of their nearest placed neighbours in embedding space.
+The whole layout is refit only when there is no usable layout yet, the configured engine
+changed, or the new events would outnumber EVENT_LAYOUT_REFIT_RATIO of the placed ones.
+"""
+import asyncio
+import os
+import weakref
+
+import numpy as np
+
+from app import async_database, projection
+from app.event_embeddings import load_event_embeddings
+
+MIN_EVENTS = 3
+LAYOUT_NEIGHBOURS = int(os.getenv("EVENT_LAYOUT_NEIGHBOURS", "5"))
+LAYOUT_REFIT_RATIO = float(os.getenv("EVENT_LAYOUT_REFIT_RATIO", "0.5"))
+
+# one lock per user that is being laid out, dropped once no coroutine holds or awaits it
+_locks = weakref.WeakValueDictionary()
+
+
+def user_lock(user_id):
+    lock = _locks.get(user_id)
+    if lock is None:
+        lock = _locks[user_id] = asyncio.Lock()
+    return lock
+
+
+def place_events(placed_embeddings, placed_coordinates, new_embeddings, k=LAYOUT_NEIGHBOURS):
+    placed = normalize(placed_embeddings)
+    new = normalize(new_embeddings)
+    coordinates = np.asarray(placed_coordinates, dtype=np.float64)
+    similarities = new @ placed.T
+    k = min(k, len(placed))
+    neighbours = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    weights = np.maximum(np.take_along_axis(similarities, neighbours, axis=1), 0) + 1e-6
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum("nk,nkd->nd", weights, coordinates[neighbours])
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+async def update_event_layout(user_id):
+    """Give every event of the user coordinates, placing new events incrementally when possible."""
+    async with user_lock(user_id):
+        events = await async_database.get_user_events(user_id)
+        missing = [event for event in events if event["coordinates"] is None]
+        if not missing or len(events) < MIN_EVENTS:
+            return 0
+        placed = [event for event in events if event["coordinates"] is not None]
+        layout = await async_database.get_event_layout(user_id)
+        method = projection.EVENT_PROJECTION
+
+        if (layout is None or layout["method"] != method
+                or len(placed) < MIN_EVENTS or len(missing) > LAYOUT_REFIT_RATIO * len(placed)):
+            engine = projection.create(method)
+            embeddings = await load_event_embeddings(events)
+            coordinates = await asyncio.to_thread(engine.fit, embeddings)
+            model = engine.dumps() if engine.can_transform else None
+            await async_database.save_event_layout(user_id, method, model, as_rows(events, coordinates))
+            return len(events)
+
+        if layout["model"] is not None:
+            engine = projection.load(method, bytes(layout["model"]))
+            coordinates = engine.transform(await load_event_embeddings(missing))
+        else:
+            embeddings = await load_event_embeddings(placed + missing)
+            coordinates = place_events(
+                embeddings[:len(placed)], [event["coordinates"] for event in placed], embeddings[len(placed):]
+            )
+        await async_database.set_event_coordinates(as_rows(missing, coordinates))
+        return len(missing)
+
+
+def as_rows(events, coordinates):
+    return [(event["event_id"], [float(c) for c in point]) for event, point in zip(events, coordinates)]
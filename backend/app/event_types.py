@@ -0,0 +1,167 @@
+"""Nearest-centroid event type classifier for /api/eventprocess.
+
+Each event type has a centroid: the normalized mean embedding of labelled example
+sentences. Sentences are embedded in one batch (through the embedding cache, so the
+POST /api/event that follows costs no extra upstream call) and labelled by cosine
+similarity to the centroids. Below EVENT_TYPE_MIN_SIMILARITY the fallback label is used.
+
+Centroids are stored per embedding model in event_type_centroids. They are fitted from
+the built-in examples on first use, or explicitly, optionally with extra labelled sentences
+from a JSON lines file of {"text", "event_type"}:
+
+    python -m app.event_types fit [--examples labelled.jsonl]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from app import async_database, providers
+from app.dependencies import get_embeddings_batch
+
+logger = logging.getLogger(__name__)
+
+MIN_SIMILARITY = float(os.getenv("EVENT_TYPE_MIN_SIMILARITY", "0.2"))
+FALLBACK_EVENT_TYPE = os.getenv("EVENT_TYPE_FALLBACK", "personal")
+# how often workers pick up centroids refit by another process
+RELOAD_SECONDS = float(os.getenv("EVENT_TYPE_RELOAD_SECONDS", "600"))
+
+EXAMPLES = {
+    "career": [
+        "She was promoted to senior engineer at the company.",
+        "He started working as an analyst at a bank.",
+        "After years in finance she founded her own startup.",
+        "He left his job to become a freelance designer.",
+        "She was hired as the director of a research lab.",
+        "His business expanded into three new markets.",
+    ],
+    "personal": [
+        "She married her longtime partner in a small ceremony.",
+        "He became a father when his daughter was born.",
+        "She moved back to her hometown to care for her parents.",
+        "He struggled with his health for several years.",
+        "She bought her first house in the suburbs.",
+        "His grandmother passed away when he was twelve.",
+    ],
+    "education": [
+        "She graduated from college with a degree in economics.",
+        "He enrolled in a master's program in computer science.",
+        "She earned her PhD after five years of research.",
+        "He attended a boarding school in the countryside.",
+        "She studied painting at an art academy.",
+        "He received a scholarship to study abroad.",
+    ],
+    "social": [
+        "She volunteered at a local shelter every weekend.",
+        "He joined a community of artists in the city.",
+        "She organized a campaign for the neighborhood school.",
+        "He made lifelong friends through the debate club.",
+        "She became an active member of her church.",
+        "He mentored young people from his old neighborhood.",
+    ],
+    "serendipity": [
+        "By chance he met an investor on a delayed flight.",
+        "A random conversation at a party changed her career path.",
+        "He unexpectedly won a prize in a lottery.",
+        "She stumbled upon an old book that sparked a new passion.",
+        "A missed train led him to meet his future business partner.",
+        "Her video unexpectedly went viral overnight.",
+    ],
+}
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class EventTypeClassifier:
+    def __init__(self, min_similarity=MIN_SIMILARITY, fallback=FALLBACK_EVENT_TYPE):
+        self.min_similarity = min_similarity
+        self.fallback = fallback
+        self.model = None
+        self.labels = None
+        self.centroids = None
+        self.loaded_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def fit(self, examples=EXAMPLES):
+        """Recompute the centroids from {event_type: [sentences]} and store them."""
+        model = providers.embedding().model
+        event_types = [event_type for event_type, texts in examples.items() if texts]
+        texts = [text for event_type in event_types for text in examples[event_type]]
+        embeddings = normalize(await get_embeddings_batch(texts))
+        labels = np.array([event_type for event_type in event_types for _ in examples[event_type]])
+        rows = [
+            (event_type, normalize(embeddings[labels == event_type].mean(axis=0)).tobytes(), len(examples[event_type]))
+            for event_type in event_types
+        ]
+        await async_database.save_event_type_centroids(model, rows)
+        self._use(model, [(event_type, centroid) for event_type, centroid, _ in rows])
+
+    async def load(self):
+        model = providers.embedding().model
+        rows = await async_database.get_event_type_centroids(model)
+        if not rows:
+            return False
+        self._use(model, [(row["event_type"], bytes(row["centroid"])) for row in rows])
+        return True
+
+    def reload(self):
+        """Forget the centroids so the next classify call reads them from the database again."""
+        self.model = None
+
+    def _use(self, model, centroids):
+        self.labels = [event_type for event_type, _ in centroids]
+        self.centroids = np.stack([np.frombuffer(centroid, dtype=np.float32) for _, centroid in centroids])
+        self.model = model
+        self.loaded_at = time.monotonic()
+
+    async def ensure_centroids(self):
+        async with self.lock:
+            if self.model == providers.embedding().model and time.monotonic() - self.loaded_at < RELOAD_SECONDS:
+                return
+            if not await self.load():
+                logger.info("No event type centroids for %s, fitting them from the built-in examples", providers.embedding().model)
+                await self.fit()
+
+    async def classify(self, texts):
+        """(event_type, similarity) for each text."""
+        if not texts:
+            return []
+        await self.ensure_centroids()
+        embeddings = normalize(await get_embeddings_batch(texts))
+        similarities = embeddings @ self.centroids.T
+        best = similarities.argmax(axis=1)
+        scores = similarities[np.arange(len(texts)), best]
+        return [
+            (self.labels[i] if score >= self.min_similarity else self.fallback, float(score))
+            for i, score in zip(best, scores)
+        ]
+
+
+event_type_classifier = EventTypeClassifier()
+
+
+def read_examples(path):
+    examples = {event_type: list(texts) for event_type, texts in EXAMPLES.items()}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                examples.setdefault(record["event_type"], []).append(record["text"])
+    return examples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["fit"])
+    parser.add_argument("--examples", help="JSON lines of {\"text\", \"event_type\"} added to the built-in examples")
+    args = parser.parse_args()
+    examples = read_examples(args.examples) if args.examples else EXAMPLES
+    asyncio.run(event_type_classifier.fit(examples))
+    print(f"Stored centroids for {len(examples)} event types ({providers.embedding().model}).")
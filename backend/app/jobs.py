@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import uuid
+
+from fastapi import HTTPException
+
+from app import async_database
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """Bounded pool of asyncio workers that run story generation jobs outside the HTTP request.
+
+    Job rows live in story_jobs, the in-memory queue only carries job ids. A worker
+    claims a job atomically before running it, so several app processes can recover
+    the same backlog on startup without running a job twice.
+    """
+
+    def __init__(self, workers=4, max_attempts=3, retry_delay=2.0, stale_after=600):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.stale_after = stale_after
+        self.handlers = {}
+        self.queue = asyncio.Queue()
+        self.tasks = []
+
+    def register(self, kind, handler, payload_type):
+        self.handlers[kind] = (handler, payload_type)
+
+    async def start(self):
+        job_ids = await async_database.requeue_stale_story_jobs(self.stale_after)
+        for job_id in job_ids:
+            self.queue.put_nowait(job_id)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def enqueue(self, kind, session_id, payload):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind {kind}")
+        # a reload of the loading page must not start a second generation for the same session,
+        # the partial unique index turns the insert into a no-op while a live job exists
+        job = await async_database.create_story_job(str(uuid.uuid4()), session_id, kind, payload)
+        if job is None:
+            return await async_database.get_latest_story_job(session_id, kind)
+        self.queue.put_nowait(job["job_id"])
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception("Story job %s crashed", job_id)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id):
+        job = await async_database.claim_story_job(job_id)
+        if job is None:
+            return
+        handler, payload_type = self.handlers[job["kind"]]
+        try:
+            result = await handler(payload_type(**job["payload"]))
+        except HTTPException as e:
+            # request errors (payment missing, story already generated) won't succeed on retry
+            await async_database.finish_story_job(job_id, "failed", None, str(e.detail))
+            return
+        except Exception as e:
+            logger.warning("Story job %s attempt %d failed: %s", job_id, job["attempts"], e)
+            if job["attempts"] >= self.max_attempts:
+                await async_database.finish_story_job(job_id, "failed", None, str(e))
+                return
+            await async_database.finish_story_job(job_id, "queued", None, str(e))
+            asyncio.get_running_loop().call_later(
+                self.retry_delay * 2 ** (job["attempts"] - 1), self.queue.put_nowait, job_id
+            )
+            return
+        await async_database.finish_story_job(job_id, "succeeded", result.model_dump(mode="json"), None)
+
+
+job_queue = JobQueue(
+    workers=int(os.getenv("STORY_JOB_WORKERS", "4")),
+    max_attempts=int(os.getenv("STORY_JOB_MAX_ATTEMPTS", "3")),
+    retry_delay=float(os.getenv("STORY_JOB_RETRY_DELAY", "2")),
+    stale_after=int(os.getenv("STORY_JOB_STALE_SECONDS", "600")),
+)
@@ -2,11 +2,25 @@ from fastapi import FastAPI, Request, Path, Depends, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import uvicorn
-from app.routers import users, friends, orders, payments, dashboard, auth, story, event
-from app import database
+from contextlib import asynccontextmanager
+from app.routers import users, friends, orders, payments, dashboard, auth, story, event, metrics, jobs
+from app import async_database
 from app import schemas
+from app.jobs import job_queue
+from app import transport
+from app.annotation import annotation_engine
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await transport.aclose()
+    await annotation_engine.stop()
+    await async_database.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
 base_url = "http://127.0.0.1:8000"
 
@@ -38,9 +52,9 @@ async def get_story_loading_page(
 @app.get("/story/{story_id}")
 async def get_story(request: Request,story_id:int):
     
-    future_story = database.get_future_story(story_id)
+    future_story = await async_database.get_future_story(story_id)
     user_id = request.query_params.get("user_id")
-    wiki_references = database.get_identified_references_by_future_story_id(story_id)
+    wiki_references = await async_database.get_identified_references_by_future_story_id(story_id)
     wiki_references = [schemas.WikiReference(**r).model_dump(mode="json") for r in wiki_references]
     return templates.TemplateResponse(
             "story.html",
@@ -74,6 +88,8 @@ app.include_router(dashboard.router)
 app.include_router(auth.router)
 app.include_router(story.router)
 app.include_router(event.router)
+app.include_router(metrics.router)
+app.include_router(jobs.router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""Versioned schema migrations for databases created before the current models.
+
+create_all only creates missing tables, so every change to an existing table is a
+numbered step with an upgrade and a downgrade. Applied versions are recorded in
+schema_migrations. Steps flagged `transactional = False` (CREATE INDEX CONCURRENTLY)
+run in autocommit so they don't lock the table against writes while they build.
+
+    python -m app.migrations status
+    python -m app.migrations upgrade [--to VERSION]
+    python -m app.migrations downgrade --to VERSION
+    python -m app.migrations check [--as-planned]
+
+init_db runs `upgrade` after create_all.
+"""
+from sqlalchemy import text
+
+from app.migrations import v0001_added_columns, v0002_foreign_key_indexes, v0003_story_job_uniqueness
+
+MIGRATIONS = [v0001_added_columns, v0002_foreign_key_indexes, v0003_story_job_uniqueness]
+
+# any constant works, it only has to be the same for every process migrating this database
+LOCK_ID = 72870201
+
+
+def ensure_table(conn):
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description VARCHAR NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """))
+
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def _run(engine, migration, step, record):
+    # index builds on big tables outlast the statement_timeout set for the app's queries
+    if migration.transactional:
+        with engine.begin() as conn:
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            step(conn)
+            record(conn)
+    else:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("SET statement_timeout = 0"))
+            try:
+                step(conn)
+                record(conn)
+            finally:
+                conn.execute(text("RESET statement_timeout"))
+
+
+def _locked(engine, fn):
+    # several app processes run init_db on startup, only one of them migrates at a time
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        # waiting for another process's migration can take longer than the app's statement_timeout
+        lock_conn.execute(text("SET statement_timeout = 0"))
+        try:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": LOCK_ID})
+            try:
+                with engine.begin() as conn:
+                    ensure_table(conn)
+                    applied = applied_versions(conn)
+                return fn(applied)
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_ID})
+        finally:
+            lock_conn.execute(text("RESET statement_timeout"))
+
+
+def upgrade(engine, target=None):
+    """Apply the pending migrations up to `target` (all by default), return their versions."""
+    def apply(applied):
+        done = []
+        for migration in MIGRATIONS:
+            if migration.version in applied or (target is not None and migration.version > target):
+                continue
+            _run(engine, migration, migration.upgrade, lambda conn: conn.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                {"version": migration.version, "description": migration.description},
+            ))
+            print(f"Applied migration {migration.version:04d} {migration.description}")
+            done.append(migration.version)
+        return done
+    return _locked(engine, apply)
+
+
+def downgrade(engine, target):
+    """Revert the applied migrations newer than `target`, newest first, return their versions."""
+    def revert(applied):
+        done = []
+        for migration in reversed(MIGRATIONS):
+            if migration.version not in applied or migration.version <= target:
+                continue
+            _run(engine, migration, migration.downgrade, lambda conn: conn.execute(
+                text("DELETE FROM schema_migrations WHERE version = :version"), {"version": migration.version}
+            ))
+            print(f"Reverted migration {migration.version:04d} {migration.description}")
+            done.append(migration.version)
+        return done
+    return _locked(engine, revert)
+
+
+def status(engine):
+    """(version, description, applied) for every known migration."""
+    with engine.begin() as conn:
+        ensure_table(conn)
+        applied = applied_versions(conn)
+    return [(migration.version, migration.description, migration.version in applied) for migration in MIGRATIONS]
+
@@ -0,0 +1,31 @@
+import argparse
+import sys
+
+from app import migrations
+from app.database import engine
+from app.migrations.check import check
+
+parser = argparse.ArgumentParser(prog="python -m app.migrations")
+parser.add_argument("command", choices=["status", "upgrade", "downgrade", "check"])
+parser.add_argument("--to", type=int, help="target version, required for downgrade (0 reverts everything)")
+parser.add_argument("--as-planned", action="store_true", help="check: keep sequential scans enabled")
+args = parser.parse_args()
+
+if args.command == "status":
+    for version, description, applied in migrations.status(engine):
+        print(f"{version:04d} {'applied' if applied else 'pending'}  {description}")
+elif args.command == "upgrade":
+    if not migrations.upgrade(engine, args.to):
+        print("Nothing to apply.")
+elif args.command == "downgrade":
+    if args.to is None:
+        parser.error("downgrade needs --to VERSION")
+    if not migrations.downgrade(engine, args.to):
+        print("Nothing to revert.")
+else:
+    missing = 0
+    for function, index, used in check(engine, args.as_planned):
+        ok = index in used
+        missing += not ok
+        print(f"{'ok     ' if ok else 'MISSING'} {function}: expects {index}, uses {', '.join(sorted(used)) or 'no index'}")
+    sys.exit(1 if missing else 0)
@@ -0,0 +1,50 @@
+"""EXPLAIN the hot lookups and report whether they use the indexes the migrations add.
+
+On a small development database the planner rightly prefers sequential scans, so by
+default the plans are taken with enable_seqscan off, which shows whether an index can
+serve the query at all. --as-planned reports the plans the planner would really pick.
+"""
+from sqlalchemy import text
+
+# (the app.async_database function it stands for, query, params, index expected in the plan)
+HOT_QUERIES = [
+    ("get_user_events",
+     "SELECT * FROM Events WHERE user_id = :user_id ORDER BY event_id",
+     {"user_id": 1}, "ix_events_user_id"),
+    ("get_events_by_story_ids",
+     "SELECT * FROM Events WHERE story_id = ANY(:story_ids)",
+     {"story_ids": [1, 2]}, "ix_events_story_id"),
+    ("get_identified_references_by_future_story_id",
+     "SELECT * FROM Identified WHERE story_id = :story_id",
+     {"story_id": 1}, "ix_identified_story_id"),
+    ("get_past_story_by_session_id",
+     "SELECT * FROM Initiated_Transactions WHERE session_id = :session_id",
+     {"session_id": 1}, "ix_initiated_transactions_session_id"),
+    ("get_all_stories_by_user_id",
+     "SELECT * FROM Generated_Stories WHERE transaction_id = :transaction_id",
+     {"transaction_id": "0"}, "ix_generated_stories_transaction_id"),
+    ("get_all_stories_by_user_id",
+     "SELECT * FROM Completed_Payments WHERE user_id = :user_id",
+     {"user_id": 1}, "completed_payments_pkey"),
+]
+
+
+def plan_indexes(plan):
+    """Names of the indexes anywhere in an EXPLAIN (FORMAT JSON) plan node."""
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        names |= plan_indexes(child)
+    return names
+
+
+def check(engine, as_planned=False):
+    """(function, expected index, indexes used) for each hot query."""
+    results = []
+    with engine.connect() as conn:
+        for function, query, params, index in HOT_QUERIES:
+            with conn.begin():
+                if not as_planned:
+                    conn.execute(text("SET LOCAL enable_seqscan = off"))
+                plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), params).scalar_one()
+            results.append((function, index, plan_indexes(plan[0]["Plan"])))
+    return results
@@ -0,0 +1,15 @@
+from sqlalchemy import text
+
+
+def create_index_concurrently(conn, index, table, column, unique=False, where=None):
+    # a failed concurrent build leaves an INVALID index behind that IF NOT EXISTS would keep
+    invalid = conn.execute(text("""
+    SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+    WHERE pg_class.relname = :index AND NOT pg_index.indisvalid
+    """), {"index": index}).first()
+    if invalid:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index}"))
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} ({column})"
+        + (f" WHERE {where}" if where else "")
+    ))
@@ -0,0 +1,22 @@
+from sqlalchemy import text
+
+version = 1
+description = "columns added to existing tables"
+transactional = True
+
+COLUMNS = [
+    ("wiki_references", "is_person", "BOOLEAN"),
+    ("events", "coordinates", "DOUBLE PRECISION[]"),
+    ("events", "embedding", "BYTEA"),
+    ("events", "embedding_model", "VARCHAR"),
+]
+
+
+def upgrade(conn):
+    for table, column, column_type in COLUMNS:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+
+
+def downgrade(conn):
+    for table, column, _ in reversed(COLUMNS):
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {column}"))
@@ -0,0 +1,26 @@
+from sqlalchemy import text
+
+from app.migrations.ops import create_index_concurrently
+
+version = 2
+description = "indexes on the foreign keys the story and event queries join on"
+transactional = False
+
+# completed_payments.user_id leads the table's primary key, which already serves it
+INDEXES = [
+    ("ix_initiated_transactions_session_id", "initiated_transactions", "session_id"),
+    ("ix_generated_stories_transaction_id", "generated_stories", "transaction_id"),
+    ("ix_identified_story_id", "identified", "story_id"),
+    ("ix_events_story_id", "events", "story_id"),
+    ("ix_events_user_id", "events", "user_id"),
+]
+
+
+def upgrade(conn):
+    for index, table, column in INDEXES:
+        create_index_concurrently(conn, index, table, column)
+
+
+def downgrade(conn):
+    for index, _, _ in reversed(INDEXES):
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index}"))
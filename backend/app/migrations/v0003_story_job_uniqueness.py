@@ -0,0 +1,25 @@
+from sqlalchemy import text
+
+from app.migrations.ops import create_index_concurrently
+
+version = 3
+description = "one live story job per session and kind"
+transactional = False
+
+
+def upgrade(conn):
+    # jobs enqueued twice before the index existed: keep the newest, fail the rest
+    conn.execute(text("""
+    UPDATE story_jobs SET status = 'failed', error = 'duplicate job', updated_at = now()
+    WHERE status <> 'failed' AND job_id NOT IN (
+        SELECT DISTINCT ON (session_id, kind) job_id FROM story_jobs
+        WHERE status <> 'failed'
+        ORDER BY session_id, kind, created_at DESC
+    )
+    """))
+    create_index_concurrently(conn, "uq_story_jobs_session_kind", "story_jobs", "session_id, kind",
+                              unique=True, where="status <> 'failed'")
+
+
+def downgrade(conn):
+    conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS uq_story_jobs_session_kind"))
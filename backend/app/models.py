@@ -1,5 +1,5 @@
 
-from sqlalchemy import Table, Column, Integer, String, Float, Date, DateTime, ForeignKey, CheckConstraint, ARRAY
+from sqlalchemy import Table, Column, Integer, String, Float, Date, DateTime, ForeignKey, CheckConstraint, Index, ARRAY, LargeBinary, Boolean, JSON, func, text
 from sqlalchemy.orm import relationship, declarative_base
 
 
@@ -57,13 +57,18 @@ class Event(Base):
     __tablename__ = 'events'
     
     event_id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey('users.user_id'))
-    story_id = Column(Integer, ForeignKey('generated_stories.story_id'))
+    user_id = Column(Integer, ForeignKey('users.user_id'), index=True)
+    story_id = Column(Integer, ForeignKey('generated_stories.story_id'), index=True)
     
     text = Column(String, nullable=False)
     annotated_text = Column(String, nullable=False)
     event_type = Column(String, nullable=False)
     event_date = Column(Date)
+    #x, y, z in the user's event layout, see app.event_layout
+    coordinates = Column(ARRAY(Float))
+    #float32 bytes of the text embedding, see app.event_embeddings
+    embedding = Column(LargeBinary)
+    embedding_model = Column(String)
     
     # Relationships
     user = relationship("Users")
@@ -135,7 +140,7 @@ class InitiatedTransaction(Base):
     __tablename__ = 'initiated_transactions'
     
     transaction_id = Column(String, primary_key=True)
-    session_id = Column(Integer, ForeignKey('sessions.session_id'), nullable=False)
+    session_id = Column(Integer, ForeignKey('sessions.session_id'), nullable=False, index=True)
     type = Column(String)
     
     # Relationships
@@ -178,7 +183,7 @@ class GeneratedStory(Base):
     __tablename__ = 'generated_stories'
     
     story_id = Column(Integer, primary_key=True, autoincrement=True)
-    transaction_id = Column(String, ForeignKey('initiated_transactions.transaction_id'), nullable=False)
+    transaction_id = Column(String, ForeignKey('initiated_transactions.transaction_id'), nullable=False, index=True)
     generated_story_text = Column(String, nullable=False)
     type = Column(String)
     
@@ -226,6 +231,7 @@ class WikiReference(Base):
     text_corpus = Column(String, nullable=False)
     url = Column(String, nullable=False)
     title = Column(String, nullable=False)
+    is_person = Column(Boolean) #filled by app.classify_references
     
     
     # Relationships
@@ -235,8 +241,74 @@ class Identified(Base):
     __tablename__ = 'identified'
     
     wiki_reference_id = Column(String, ForeignKey('wiki_references.wiki_reference_id'), primary_key=True)
-    story_id = Column(Integer, ForeignKey('generated_stories.story_id'), primary_key=True)
+    story_id = Column(Integer, ForeignKey('generated_stories.story_id'), primary_key=True, index=True)
     similarity = Column(Float, nullable=False)
     # Relationships
     wiki_reference = relationship("WikiReference", back_populates="identifications")
     story = relationship("GeneratedStory", back_populates="identifications")
+
+
+class EmbeddingCache(Base):
+    #persistent tier of app.embedding_cache, vectors are stored as raw float32 bytes
+    __tablename__ = 'embedding_cache'
+
+    model = Column(String, primary_key=True)
+    text_hash = Column(String(64), primary_key=True)
+    embedding = Column(LargeBinary, nullable=False)
+    last_used_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+
+
+class StoryJob(Base):
+    #background past/future story generation, see app.jobs
+    __tablename__ = 'story_jobs'
+
+    job_id = Column(String, primary_key=True)
+    session_id = Column(Integer, ForeignKey('sessions.session_id'), nullable=False)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON)
+    error = Column(String)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        CheckConstraint("kind IN ('past_story', 'future_story')"),
+        CheckConstraint("status IN ('queued', 'running', 'succeeded', 'failed')"),
+        #at most one live job per session and kind, a failed one can be enqueued again
+        Index('uq_story_jobs_session_kind', 'session_id', 'kind', unique=True,
+              postgresql_where=text("status <> 'failed'")),
+    )
+
+
+class PastStoryCache(Base):
+    #biographies from generate_past_story keyed by the hash of the normalized profile and prompt version
+    __tablename__ = 'past_story_cache'
+
+    profile_hash = Column(String(64), primary_key=True)
+    prompt_version = Column(String, nullable=False)
+    generated_story_text = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class EventLayout(Base):
+    #fitted app.projection model behind a user's event coordinates, used to place new events
+    __tablename__ = 'event_layouts'
+
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True)
+    method = Column(String, nullable=False)
+    model = Column(LargeBinary)
+    event_count = Column(Integer, nullable=False)
+    fitted_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class EventTypeCentroid(Base):
+    #app.event_types classifier state, one normalized float32 centroid per embedding model and event type
+    __tablename__ = 'event_type_centroids'
+
+    model = Column(String, primary_key=True)
+    event_type = Column(String, primary_key=True)
+    centroid = Column(LargeBinary, nullable=False)
+    example_count = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
@@ -0,0 +1,163 @@
+"""Projection of event embeddings into the 3D space of the event visualization.
+
+    pca         centered SVD, new points are projected with the fitted components
+    parametric  t-SNE layout plus a ridge regression from embeddings onto it, so new
+                points get t-SNE-like positions in O(d) each
+    tsne        plain t-SNE, cannot place new points; app.event_layout falls back to
+                nearest neighbour placement for it
+
+EVENT_PROJECTION picks the engine, pca by default.
+
+    python -m app.projection benchmark [--sizes 50 200 1000] [--methods pca parametric tsne]
+"""
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+
+EVENT_PROJECTION = os.getenv("EVENT_PROJECTION", "pca")
+TSNE_PERPLEXITY = float(os.getenv("EVENT_TSNE_PERPLEXITY", "3"))
+DIMENSIONS = 3
+
+
+def run_tsne(embeddings):
+    from sklearn.manifold import TSNE
+    # t-SNE needs perplexity < n_samples
+    perplexity = min(TSNE_PERPLEXITY, len(embeddings) - 1)
+    return TSNE(n_components=DIMENSIONS, random_state=42, perplexity=perplexity).fit_transform(embeddings)
+
+
+class Projection:
+    method = None
+    fields = ()
+
+    def fit(self, embeddings):
+        """Fit on the embeddings and return their coordinates."""
+        raise NotImplementedError
+
+    def transform(self, embeddings):
+        raise NotImplementedError
+
+    @property
+    def can_transform(self):
+        return True
+
+    def dumps(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, **{field: getattr(self, field) for field in self.fields})
+        return buffer.getvalue()
+
+    @classmethod
+    def loads(cls, data):
+        projection = cls()
+        with np.load(io.BytesIO(data)) as arrays:
+            for field in cls.fields:
+                setattr(projection, field, arrays[field])
+        return projection
+
+
+class PCAProjection(Projection):
+    method = "pca"
+    fields = ("mean", "components")
+
+    def fit(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        self.mean = embeddings.mean(axis=0)
+        _, _, vt = np.linalg.svd(embeddings - self.mean, full_matrices=False)
+        components = np.zeros((DIMENSIONS, embeddings.shape[1]))
+        components[:min(DIMENSIONS, len(vt))] = vt[:DIMENSIONS]
+        # fix the sign of each axis so refits on similar data do not mirror the layout
+        signs = np.sign(components[np.arange(DIMENSIONS), np.abs(components).argmax(axis=1)])
+        self.components = components * np.where(signs == 0, 1, signs)[:, None]
+        return self.transform(embeddings)
+
+    def transform(self, embeddings):
+        return (np.asarray(embeddings, dtype=np.float64) - self.mean) @ self.components.T
+
+
+class ParametricProjection(Projection):
+    method = "parametric"
+    fields = ("mean", "weights", "offset")
+    ridge = 1e-2
+
+    def fit(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        coordinates = run_tsne(embeddings)
+        self.mean = embeddings.mean(axis=0)
+        self.offset = coordinates.mean(axis=0)
+        centered = embeddings - self.mean
+        # dual form of ridge regression, the system is n x n and there are fewer events than dimensions
+        gram = centered @ centered.T
+        alpha = np.linalg.solve(gram + self.ridge * np.trace(gram) / len(gram) * np.eye(len(gram)), coordinates - self.offset)
+        self.weights = centered.T @ alpha
+        return coordinates
+
+    def transform(self, embeddings):
+        return (np.asarray(embeddings, dtype=np.float64) - self.mean) @ self.weights + self.offset
+
+
+class TSNEProjection(Projection):
+    method = "tsne"
+
+    def fit(self, embeddings):
+        return run_tsne(np.asarray(embeddings, dtype=np.float64))
+
+    @property
+    def can_transform(self):
+        return False
+
+
+PROJECTIONS = {p.method: p for p in (PCAProjection, ParametricProjection, TSNEProjection)}
+
+
+def create(method=None):
+    method = method or EVENT_PROJECTION
+    if method not in PROJECTIONS:
+        raise ValueError(f"Unknown projection {method}, expected one of {', '.join(PROJECTIONS)}")
+    return PROJECTIONS[method]()
+
+
+def load(method, data):
+    return PROJECTIONS[method].loads(data)
+
+
+def synthetic_embeddings(n, dim=768, clusters=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    labels = rng.integers(clusters, size=n)
+    return centers[labels] + 0.5 * rng.standard_normal((n, dim))
+
+
+def benchmark(sizes, methods, neighbours=5):
+    from sklearn.manifold import trustworthiness
+    print(f"{'method':<12}{'events':>8}{'fit s':>10}{'place ms/pt':>13}{'trust':>8}{'held-out trust':>16}")
+    for n in sizes:
+        # held-out points come from the same clusters and are only placed, never fitted
+        held_out_count = max(n // 10, 2 * neighbours + 1)
+        embeddings = synthetic_embeddings(n + held_out_count)
+        embeddings, held_out = embeddings[:n], embeddings[n:]
+        for method in methods:
+            projection = create(method)
+            started = time.perf_counter()
+            coordinates = projection.fit(embeddings)
+            fit_seconds = time.perf_counter() - started
+            trust = trustworthiness(embeddings, coordinates, n_neighbors=neighbours)
+            if projection.can_transform:
+                started = time.perf_counter()
+                placed = projection.transform(held_out)
+                place_ms = (time.perf_counter() - started) * 1000 / len(held_out)
+                held_out_trust = trustworthiness(held_out, placed, n_neighbors=neighbours)
+                print(f"{method:<12}{n:>8}{fit_seconds:>10.3f}{place_ms:>13.4f}{trust:>8.3f}{held_out_trust:>16.3f}")
+            else:
+                print(f"{method:<12}{n:>8}{fit_seconds:>10.3f}{'-':>13}{trust:>8.3f}{'-':>16}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["benchmark"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--methods", nargs="+", choices=list(PROJECTIONS), default=list(PROJECTIONS))
+    args = parser.parse_args()
+    benchmark(args.sizes, args.methods)
@@ -0,0 +1,369 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from app import transport
+from app.vector_index import VectorIndex, matches_filter
+
+# Outbound services behind one small interface each. The remote implementations wrap the
+# real SDKs, the local ones are deterministic stand-ins with configurable latency so the
+# request paths can be benchmarked without network access or API keys.
+#
+#   ECHO_PROVIDERS=remote|local        default for every kind, VECTOR_PROVIDER also takes ann
+#   CHAT_PROVIDER, EMBEDDING_PROVIDER, VECTOR_PROVIDER, WIKI_PROVIDER   per kind override
+#   LOCAL_PROVIDER_LATENCY_MS          added to every local call
+
+
+class ChatProvider:
+    name = None
+
+    async def complete(self, model, messages):
+        raise NotImplementedError
+
+    async def stream(self, model, messages):
+        """Async iterator over the text chunks of the completion."""
+        raise NotImplementedError
+
+
+class EmbeddingProvider:
+    model = None
+
+    async def embed(self, texts):
+        raise NotImplementedError
+
+
+class VectorProvider:
+    async def query(self, vector, top_k, query_filter=None):
+        """Return the top_k matches as dicts with id, score and metadata."""
+        raise NotImplementedError
+
+    def list_ids(self, batch_size=100):
+        raise NotImplementedError
+
+    def fetch_metadata(self, ids):
+        raise NotImplementedError
+
+    def fetch_vectors(self, ids):
+        """{id: (values, metadata)} for the ids that exist."""
+        raise NotImplementedError
+
+    def update_metadata(self, vector_id, metadata):
+        raise NotImplementedError
+
+
+class WikiProvider:
+    def load_page(self, title):
+        """Blocking fetch of a page snapshot: {"title", "categories", "sections"}."""
+        raise NotImplementedError
+
+
+class OpenAIChatProvider(ChatProvider):
+    def __init__(self, name, api_key, base_url=None):
+        from openai import AsyncOpenAI
+        self.name = name
+        # retries are done by the shared transport
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=transport.client(name), max_retries=0)
+
+    async def complete(self, model, messages):
+        response = await self.client.chat.completions.create(model=model, messages=messages, stream=False)
+        return response.choices[0].message.content
+
+    async def stream(self, model, messages):
+        stream = await self.client.chat.completions.create(model=model, messages=messages, stream=True)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class CohereEmbeddingProvider(EmbeddingProvider):
+    model = 'multilingual-22-12'
+
+    def __init__(self, api_key):
+        import cohere
+        # the SDK sends its own per-request timeout, which is None when it is handed a client
+        self.client = cohere.AsyncClient(api_key, timeout=transport.timeout_for("cohere"), httpx_client=transport.client("cohere"))
+
+    async def embed(self, texts):
+        # one request for the whole list, the SDK splits it into max-size batches if needed
+        response = await self.client.embed(texts=texts, model=self.model, request_options={"max_retries": 0})
+        return response.embeddings
+
+
+class PineconeVectorProvider(VectorProvider):
+    def __init__(self, api_key, host):
+        from pinecone.grpc import PineconeGRPC
+        self.index = PineconeGRPC(api_key=api_key).Index(host=host)
+
+    async def query(self, vector, top_k, query_filter=None):
+        # the gRPC index client is blocking, keep it off the event loop
+        response = await asyncio.to_thread(
+            self.index.query, vector=vector, top_k=top_k, filter=query_filter, include_metadata=True
+        )
+        return [{"id": m.id, "score": m.score, "metadata": m.metadata} for m in response.matches]
+
+    def list_ids(self, batch_size=100):
+        return self.index.list(limit=batch_size)
+
+    def fetch_metadata(self, ids):
+        return {vector_id: metadata for vector_id, (_, metadata) in self.fetch_vectors(ids).items()}
+
+    def fetch_vectors(self, ids):
+        response = self.index.fetch(ids=ids)
+        return {vector_id: (list(vector.values), vector.metadata or {}) for vector_id, vector in response.vectors.items()}
+
+    def update_metadata(self, vector_id, metadata):
+        self.index.update(id=vector_id, set_metadata=metadata)
+
+
+class WikipediaProvider(WikiProvider):
+    def __init__(self):
+        import wikipediaapi
+        self.wiki = wikipediaapi.Wikipedia(user_agent="echo-project-1", language='en', timeout=transport.timeout_for("wikipedia"))
+        transport.mount_requests_session(self.wiki._session, "wikipedia")
+
+    def load_page(self, title):
+        # wikipediaapi pages are lazy, so touch everything we need here and hand back a plain snapshot
+        page = self.wiki.page(title)
+        return {
+            "title": page.title,
+            "categories": list(page.categories.keys()),
+            "sections": self.serialize_sections(page.sections),
+        }
+
+    def serialize_sections(self, sections):
+        return [
+            {"title": s.title, "text": s.text, "sections": self.serialize_sections(s.sections)}
+            for s in sections
+        ]
+
+
+def local_latency():
+    return float(os.getenv("LOCAL_PROVIDER_LATENCY_MS", "0")) / 1000
+
+
+def stable_seed(*parts):
+    return int.from_bytes(hashlib.sha256("\0".join(map(str, parts)).encode("utf-8")).digest()[:8], "little")
+
+
+class LocalChatProvider(ChatProvider):
+    name = "local"
+
+    def __init__(self, words=300, latency=None):
+        self.words = words
+        self.latency = local_latency() if latency is None else latency
+
+    def canned_text(self, model, messages):
+        rng = np.random.default_rng(stable_seed(model, json.dumps(messages)))
+        vocabulary = re.findall(r"[A-Za-z]+", " ".join(m["content"] for m in messages)) or ["echo"]
+        words = rng.choice(vocabulary, size=self.words)
+        sentences = [" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, self.words, 12)]
+        return "\n\n".join(" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5))
+
+    async def complete(self, model, messages):
+        await asyncio.sleep(self.latency)
+        return self.canned_text(model, messages)
+
+    async def stream(self, model, messages):
+        await asyncio.sleep(self.latency)
+        for word in re.split(r"(?<=\s)", self.canned_text(model, messages)):
+            yield word
+            await asyncio.sleep(0)
+
+
+@lru_cache(maxsize=100000)
+def token_vector(token, dim):
+    return np.random.default_rng(stable_seed("token", token)).standard_normal(dim).astype(np.float32)
+
+
+class HashEmbeddingProvider(EmbeddingProvider):
+    """Bag-of-words hashing embeddings: deterministic, and texts sharing words end up close."""
+
+    def __init__(self, dim=768, latency=None):
+        self.dim = dim
+        self.model = f"local-hash-{dim}"
+        self.latency = local_latency() if latency is None else latency
+
+    def embed_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            vector += token_vector(token, self.dim)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    async def embed(self, texts):
+        await asyncio.sleep(self.latency)
+        return [self.embed_one(text) for text in texts]
+
+
+class InMemoryVectorProvider(VectorProvider):
+    """Brute-force cosine search over vectors held in memory.
+
+    Loads a JSON lines file of {"id", "values", "metadata"} when path is given, otherwise
+    builds a synthetic corpus of fake historical figures embedded with `embedder`.
+    """
+
+    def __init__(self, embedder, path=None, size=1000, latency=None):
+        self.latency = local_latency() if latency is None else latency
+        if path:
+            with open(path) as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            self.ids = [r["id"] for r in records]
+            self.metadata = [r.get("metadata", {}) for r in records]
+            vectors = np.array([r["values"] for r in records], dtype=np.float32)
+        else:
+            self.ids = [f"local-{i}" for i in range(size)]
+            self.metadata = [
+                {
+                    "title": f"Local Figure {i}",
+                    "text": f"Local Figure {i} " + LocalWikiProvider.section_text(f"Local Figure {i}", "Life"),
+                    "url": f"https://en.wikipedia.org/wiki/Local_Figure_{i}",
+                }
+                for i in range(size)
+            ]
+            vectors = np.array([embedder.embed_one(m["text"]) for m in self.metadata], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.maximum(norms, 1e-12)
+        self.positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+
+    async def query(self, vector, top_k, query_filter=None):
+        await asyncio.sleep(self.latency)
+        query = np.asarray(vector, dtype=np.float32)
+        scores = self.vectors @ (query / max(np.linalg.norm(query), 1e-12))
+        order = np.argsort(-scores)
+        matches = []
+        for i in order:
+            if matches_filter(self.metadata[i], query_filter):
+                matches.append({"id": self.ids[i], "score": float(scores[i]), "metadata": self.metadata[i]})
+                if len(matches) == top_k:
+                    break
+        return matches
+
+    def list_ids(self, batch_size=100):
+        for start in range(0, len(self.ids), batch_size):
+            yield self.ids[start:start + batch_size]
+
+    def fetch_metadata(self, ids):
+        return {vector_id: self.metadata[self.positions[vector_id]] for vector_id in ids if vector_id in self.positions}
+
+    def fetch_vectors(self, ids):
+        return {
+            vector_id: (self.vectors[self.positions[vector_id]].tolist(), self.metadata[self.positions[vector_id]])
+            for vector_id in ids if vector_id in self.positions
+        }
+
+    def update_metadata(self, vector_id, metadata):
+        self.metadata[self.positions[vector_id]].update(metadata)
+
+
+class LocalANNVectorProvider(VectorProvider):
+    """Searches an exported index directory in-process, see app.vector_index.
+    Metadata updates are not supported; reclassify against Pinecone and export again."""
+
+    def __init__(self, path, mode="exact", ef=64):
+        self.index = VectorIndex(path, mode=mode, ef=ef)
+
+    async def query(self, vector, top_k, query_filter=None):
+        # numpy and hnswlib release the GIL, so a thread keeps large scans off the event loop
+        return await asyncio.to_thread(self.index.query, vector, top_k, query_filter)
+
+    def list_ids(self, batch_size=100):
+        return self.index.list_ids(batch_size)
+
+    def fetch_metadata(self, ids):
+        return self.index.fetch_metadata(ids)
+
+    def fetch_vectors(self, ids):
+        return {
+            vector_id: (self.index.vectors[self.index.positions[vector_id]].tolist(), metadata)
+            for vector_id, metadata in self.index.fetch_metadata(ids).items()
+        }
+
+
+class LocalWikiProvider(WikiProvider):
+    SECTIONS = ["Early life", "Education", "Career", "Personal life", "Legacy"]
+
+    def __init__(self, latency=None):
+        self.latency = local_latency() if latency is None else latency
+
+    @staticmethod
+    def section_text(title, section):
+        rng = np.random.default_rng(stable_seed(title, section))
+        words = rng.choice(["studied", "worked", "moved", "founded", "wrote", "married", "taught",
+                            "traveled", "painted", "invented", "led", "retired"], size=80)
+        return f"{title} " + " ".join(words) + "."
+
+    def load_page(self, title):
+        time.sleep(self.latency)
+        return {
+            "title": title,
+            "categories": ["Category:People from Localville", "Category:Local people"],
+            "sections": [
+                {"title": section, "text": self.section_text(title, section), "sections": []}
+                for section in self.SECTIONS
+            ] + [{"title": "References", "text": "", "sections": []}],
+        }
+
+
+def provider_setting(kind):
+    return os.getenv(f"{kind.upper()}_PROVIDER", os.getenv("ECHO_PROVIDERS", "remote"))
+
+
+_providers = {}
+
+
+def _cached(key, factory):
+    # created on first use, so importing the app needs no API keys
+    if key not in _providers:
+        _providers[key] = factory()
+    return _providers[key]
+
+
+def chat(name):
+    """Chat provider for one upstream, `deepseek` or `openai`."""
+    if provider_setting("chat") == "local":
+        return _cached(("chat", "local"), lambda: LocalChatProvider(words=int(os.getenv("LOCAL_COMPLETION_WORDS", "300"))))
+    if name == "deepseek":
+        return _cached(("chat", name), lambda: OpenAIChatProvider(name, os.getenv("DEEPSEEK_API_KEY"), "https://api.deepseek.com"))
+    if name == "openai":
+        return _cached(("chat", name), lambda: OpenAIChatProvider(name, os.getenv("OPENAI_API_KEY")))
+    raise ValueError(f"Unknown chat provider {name}")
+
+
+def embedding():
+    if provider_setting("embedding") == "local":
+        return _cached("embedding", lambda: HashEmbeddingProvider(dim=int(os.getenv("LOCAL_EMBEDDING_DIM", "768"))))
+    return _cached("embedding", lambda: CohereEmbeddingProvider(os.getenv("COHERE_API_KEY")))
+
+
+def vector():
+    """VECTOR_PROVIDER=remote (Pinecone), ann (exported index searched in-process) or local (synthetic)."""
+    setting = provider_setting("vector")
+    if setting == "local":
+        return _cached("vector", lambda: InMemoryVectorProvider(
+            HashEmbeddingProvider(dim=int(os.getenv("LOCAL_EMBEDDING_DIM", "768")), latency=0),
+            path=os.getenv("LOCAL_VECTOR_INDEX_PATH"),
+            size=int(os.getenv("LOCAL_VECTOR_COUNT", "1000")),
+        ))
+    if setting == "ann":
+        return _cached("vector", lambda: LocalANNVectorProvider(
+            os.getenv("ANN_INDEX_DIR", "vector_index"),
+            mode=os.getenv("ANN_MODE", "exact"),
+            ef=int(os.getenv("ANN_EF", "64")),
+        ))
+    return remote_vector()
+
+
+def remote_vector():
+    return _cached("remote_vector", lambda: PineconeVectorProvider(os.getenv("PINECONE_API_KEY"), os.getenv("PINECONE_INDEX_HOST")))
+
+
+def wiki():
+    if provider_setting("wiki") == "local":
+        return _cached("wiki", LocalWikiProvider)
+    return _cached("wiki", WikipediaProvider)
@@ -0,0 +1,75 @@
+import numpy as np
+
+# sections from here on are bibliography/navigation, not biography
+STOP_SECTIONS = frozenset([
+    "See also", "References", "External links", "Further reading", "Notes and references",
+    "Bibliography", "Sources", "Literature", "Footnotes", "Works cited", "Citations",
+    "Photo gallery", "Quotations", "External media", "Related topics", "Related articles",
+])
+
+
+def split_sections(sections, level=0):
+    """Flatten a page's nested sections into (level, title, text), stopping at STOP_SECTIONS like get_all_sections."""
+    result = []
+    for s in sections:
+        if s["title"] in STOP_SECTIONS:
+            break
+        if s["text"].strip():
+            result.append((level, s["title"], s["text"]))
+        result.extend(split_sections(s["sections"], level + 1))
+    return result
+
+
+def format_section(level, title, text):
+    return "%s: %s - %s" % ("*" * (level + 1), title, text)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text, close enough for budgeting
+    return len(text) // 4 + 1
+
+
+def pack_sections(sections, scores, token_budget):
+    """Pick the highest scoring sections that fit in token_budget and return them in page order."""
+    chosen = []
+    remaining = token_budget
+    for i in np.argsort(-np.asarray(scores), kind="stable"):
+        cost = estimate_tokens(sections[i])
+        if cost <= remaining:
+            chosen.append((i, sections[i]))
+            remaining -= cost
+        elif not chosen:
+            # the best section alone is over budget, keep its beginning rather than nothing
+            chosen.append((i, sections[i][:remaining * 4]))
+            remaining = 0
+        if remaining <= 0:
+            break
+    return [text for _, text in sorted(chosen)]
+
+
+def rank_sections(query_embedding, section_embeddings):
+    query = np.asarray(query_embedding, dtype=np.float32)
+    sections = np.asarray(section_embeddings, dtype=np.float32)
+    norms = np.linalg.norm(sections, axis=1) * np.linalg.norm(query)
+    return sections @ query / np.maximum(norms, 1e-12)
+
+
+async def build_reference_context(biography, pages, token_budget, embed):
+    """Context for the tui_suan prompt: each page gets an equal share of token_budget,
+    filled with its sections most similar to the biography."""
+    page_sections = [[format_section(*section) for section in split_sections(page["sections"])] for page in pages]
+    page_sections = [(page, sections) for page, sections in zip(pages, page_sections) if sections]
+    if not page_sections:
+        return ""
+    all_sections = [text for _, sections in page_sections for text in sections]
+    embeddings = await embed([biography] + all_sections)
+    scores = rank_sections(embeddings[0], embeddings[1:])
+
+    per_page_budget = token_budget // len(page_sections)
+    context = []
+    start = 0
+    for page, sections in page_sections:
+        page_scores = scores[start:start + len(sections)]
+        start += len(sections)
+        context.append("\n".join(pack_sections(sections, page_scores, per_page_budget)))
+    return "\n" + "\n".join(context)
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Circuit breakers and request hedging for the upstream services, one of each per name
+# (deepseek, openai, embedding, vector). The transport already retries single requests,
+# this layer decides whether to call an upstream at all and when to race a second copy.
+#
+#   BREAKER_FAILURE_THRESHOLD   consecutive failed or slow calls that open a breaker
+#   BREAKER_RESET_SECONDS       how long a breaker stays open before letting one probe through
+#   <NAME>_SLOW_CALL_SECONDS    calls slower than this count as failures, e.g. DEEPSEEK_SLOW_CALL_SECONDS
+#   HEDGE_PERCENTILE            a hedge is sent once a call outlives this latency percentile
+#   HEDGE_MIN_SAMPLES           no hedging until this many latencies have been observed for a call size
+
+DEFAULT_SLOW_CALL_SECONDS = {"deepseek": 60.0, "openai": 60.0, "embedding": 10.0, "vector": 5.0}
+FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = 0.01
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} circuit is open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_upstream_failure(error):
+    # 4xx answers other than 429 are the caller's fault, the upstream itself is healthy
+    status = getattr(error, "status_code", None)
+    return not isinstance(status, int) or status == 429 or status >= 500
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures or slow calls,
+    open -> half_open after `reset_seconds`, where a single probe call decides whether
+    it closes again. Calls made while open fail fast with CircuitOpenError."""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, slow_call_seconds=None, reset_seconds=RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def acquire(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self.probing):
+            self.stats["rejected"] += 1
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(self.name, retry_in)
+        if state == "half_open":
+            self.probing = True
+        self.stats["calls"] += 1
+
+    def on_success(self, elapsed=None):
+        if self.slow_call_seconds is not None and elapsed is not None and elapsed > self.slow_call_seconds:
+            self.stats["slow_calls"] += 1
+            self._fail(f"slow call ({elapsed:.1f}s)")
+            return
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def on_failure(self, error):
+        if not is_upstream_failure(error):
+            self.on_success()
+            return
+        self.stats["failures"] += 1
+        self._fail(repr(error))
+
+    def release(self):
+        # the call was cancelled before it had an outcome, let the next caller probe instead
+        self.probing = False
+
+    def _fail(self, reason):
+        self.failures += 1
+        self.probing = False
+        if self.state == "open":
+            return
+        # a failed half_open probe reopens straight away
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.stats["opened"] += 1
+            logger.warning("Opening %s circuit after %s", self.name, reason)
+            self.opened_at = time.monotonic()
+
+    async def call(self, fn):
+        self.acquire()
+        started = time.monotonic()
+        try:
+            result = await fn()
+        except Exception as e:
+            self.on_failure(e)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.on_success(time.monotonic() - started)
+        return result
+
+    def snapshot(self):
+        return {**self.stats, "state": self.state, "consecutive_failures": self.failures}
+
+
+def size_bucket(size):
+    # powers of two, a 100 text embedding batch is timed against 65-128 text batches only
+    return 1 << max(0, size - 1).bit_length()
+
+
+class Hedger:
+    """Races a duplicate of an idempotent call once the first one has taken longer than
+    the `percentile` of recent latencies for calls of the same size, and returns whichever
+    succeeds first. `size` is whatever the latency scales with, e.g. texts in a batch."""
+
+    def __init__(self, name, percentile=HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES, window=500):
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.latencies = {}
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0}
+
+    def delay(self, size=1):
+        latencies = self.latencies.get(size_bucket(size), ())
+        if self.percentile <= 0 or len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(ordered[index], HEDGE_MIN_DELAY)
+
+    def record(self, size, latency):
+        bucket = size_bucket(size)
+        if bucket not in self.latencies:
+            self.latencies[bucket] = deque(maxlen=self.window)
+        self.latencies[bucket].append(latency)
+
+    async def run(self, fn, size=1):
+        self.stats["calls"] += 1
+        primary = asyncio.ensure_future(fn())
+        tasks = [primary]
+        started = {primary: time.monotonic()}
+        try:
+            delay = self.delay(size)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.stats["hedged"] += 1
+                    hedge = asyncio.ensure_future(fn())
+                    tasks.append(hedge)
+                    started[hedge] = time.monotonic()
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # check in launch order so a tie goes to the primary
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is None:
+                        # the winner's own latency, a hedge that won was not slow by the primary's clock
+                        self.record(size, time.monotonic() - started[task])
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def snapshot(self):
+        hedged = self.stats["hedged"]
+        return {
+            **self.stats,
+            "hedge_win_rate": self.stats["hedge_wins"] / hedged if hedged else 0.0,
+            "hedge_delays": {bucket: self.delay(bucket) for bucket in sorted(self.latencies)},
+        }
+
+
+_breakers = {}
+_hedgers = {}
+
+
+def slow_call_seconds(name):
+    value = os.getenv(f"{name.upper()}_SLOW_CALL_SECONDS", DEFAULT_SLOW_CALL_SECONDS.get(name))
+    return float(value) if value is not None else None
+
+
+def breaker(name):
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name, slow_call_seconds=slow_call_seconds(name))
+    return _breakers[name]
+
+
+def hedger(name):
+    if name not in _hedgers:
+        _hedgers[name] = Hedger(name)
+    return _hedgers[name]
+
+
+def stats():
+    return {
+        "circuit_breakers": {name: b.snapshot() for name, b in _breakers.items()},
+        "hedging": {name: h.snapshot() for name, h in _hedgers.items()},
+    }
@@ -1,11 +1,16 @@
+import logging
+
 from fastapi import APIRouter, Query
-from app import database, schemas
+from app import async_database, schemas
 from pydantic import BaseModel
-from app.dependencies import nlp, get_embeddings, tsne
+from app.annotation import annotation_engine
+from app.event_types import event_type_classifier
+from app.event_layout import update_event_layout
+from app.event_embeddings import embed_events
 from typing import List
 from datetime import date
-import random
-import numpy as np
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/api",
@@ -45,28 +50,16 @@ class EventVisual(ProcessedEvent):
 
 @router.post("/eventprocess")
 async def process_event(request: ProcessEventRequest) -> List[ProcessedEvent]:
-    doc = nlp(request.text)
+    sentences = await annotation_engine.annotate(request.text)
+    event_types = await event_type_classifier.classify([sentence_text for sentence_text, _ in sentences])
     events = []
-    for sentence in doc.sents:
-       labeled_sentence = ""
-       last_end = 0
-       sentence_start = sentence.start_char
-       for ent in sentence.ents:
-           start = ent.start_char - sentence_start
-           end = ent.end_char - sentence_start
-           labeled_sentence += sentence.text[last_end:start]
-           labeled_entity = f"[{ent.label_}]{ent.text}[/{ent.label_}]"
-           labeled_sentence += labeled_entity
-           last_end = end
-           
-       labeled_sentence += sentence.text[last_end:]
-       labeled_sentence = labeled_sentence.rstrip("\n")
+    for (sentence_text, labeled_sentence), (event_type, _) in zip(sentences, event_types):
        event = {
                 "user_id": request.user_id,
                 "story_id": request.story_id,
                 "annotated_text": labeled_sentence,
-                "text": sentence.text,
-                "event_type": random.choice(["career", "personal", "education", "social", "serendipity"]), #to be done 
+                "text": sentence_text,
+                "event_type": event_type,
                 # "event_date": date.today() #to be done
             }
        events.append(event)
@@ -76,38 +69,50 @@ async def process_event(request: ProcessEventRequest) -> List[ProcessedEvent]:
         
 @router.post("/event")
 async def create_event(events: List[ProcessedEvent]) -> List[schemas.Event]:
-    created_events = []
-    for event in events:
-        created_event = database.create_event(event)
-        created_events.append(created_event)
+    # one embedding call for the whole batch, stored with the rows so readers never re-embed
+    try:
+        embedding_model, embeddings = await embed_events([event.text for event in events])
+    except Exception as e:
+        # saving events doesn't depend on the embedding service, load_event_embeddings fills them in later
+        logger.warning("Embedding %d new events failed, storing them without vectors: %s", len(events), e)
+        embedding_model, embeddings = None, None
+    created_events = await async_database.create_events(events, embeddings, embedding_model)
+    for user_id in {event.user_id for event in events}:
+        # the rows are committed, a failed layout must not turn into an error the client retries;
+        # GET /api/event places whatever is still missing coordinates
+        try:
+            await update_event_layout(user_id)
+        except Exception:
+            logger.exception("Updating the event layout of user %s failed", user_id)
     return created_events
 
 @router.get("/event")
 async def get_events(user_id: int, story_ids: List[int] = Query(...,description = 'List of story ids')) -> List[EventVisual]:
     assert len(story_ids) > 0, "story_ids must be provided"
     
-    events = database.get_events_by_story_ids(story_ids)
-    events = [schemas.Event(**event) for event in events if event["user_id"] == user_id]
+    events = await async_database.get_user_events(user_id, story_ids)
+    if any(event["coordinates"] is None for event in events):
+        # events stored before layouts were persisted get placed on first read
+        await update_event_layout(user_id)
+        events = await async_database.get_user_events(user_id, story_ids)
+    events = [event for event in events if event["coordinates"] is not None]
     
     if len(events) < 3:
         return []
     
-    embeddings = np.array([get_embeddings(event.text) for event in events])
-    tsne_result = tsne.fit_transform(embeddings)
-    tsne_result = tsne_result.tolist()
     event_visuals = [
         EventVisual(
-            user_id=event.user_id,
-            story_id=event.story_id,
-            text=event.text,
+            user_id=event["user_id"],
+            story_id=event["story_id"],
+            text=event["text"],
             future_ind=True,
-            annotated_text=event.annotated_text,
-            event_type=event.event_type,
-            event_date=event.event_date,
-            event_id=event.event_id,
-            coordinates=coordinates
+            annotated_text=event["annotated_text"],
+            event_type=event["event_type"],
+            event_date=event["event_date"],
+            event_id=event["event_id"],
+            coordinates=event["coordinates"]
         )
-        for event, coordinates in zip(events, tsne_result)
+        for event in events
     ]
 
     return event_visuals
\ No newline at end of file
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException
-from app import schemas,database
+from app import schemas,async_database
 from typing import List
 
 router = APIRouter(
@@ -10,7 +10,7 @@ router = APIRouter(
 @router.post("/", response_model=schemas.Friend)
 async def add_friend(friend: schemas.FriendCreate) -> schemas.Friend:
     try:
-        created_friend = database.insert_friend(friend.user_id_left, friend.user_id_right)
+        created_friend = await async_database.insert_friend(friend.user_id_left, friend.user_id_right)
         return created_friend
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) 
@@ -19,7 +19,7 @@ async def add_friend(friend: schemas.FriendCreate) -> schemas.Friend:
 @router.get("/{user_id}", response_model=List[schemas.Users])
 async def get_friends(user_id: int) -> List[schemas.Users]:
     try:
-        friends = database.get_user_friends(user_id)
+        friends = await async_database.get_user_friends(user_id)
         return friends
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -28,7 +28,7 @@ async def get_friends(user_id: int) -> List[schemas.Users]:
 @router.get("/discover/{user_id}", response_model=List[schemas.Users])
 async def discover_friends(user_id: int) -> List[schemas.Users]:
 
-        friends_ids = [friend['user_id'] for friend in database.get_user_friends(user_id)]
+        friends_ids = [friend['user_id'] for friend in await async_database.get_user_friends(user_id)]
         exclude_ids = friends_ids + [user_id]
-        discoverable_users = database.get_random_users(exclude_ids, limit=5)
+        discoverable_users = await async_database.get_random_users(exclude_ids, limit=5)
         return discoverable_users
\ No newline at end of file
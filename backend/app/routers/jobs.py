@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException
+from app import async_database, schemas
+from app.jobs import job_queue
+from app.routers.story import yun_suan, tui_suan
+
+
+router = APIRouter(
+    prefix="/api",
+    tags=["jobs"]
+)
+
+job_queue.register("past_story", yun_suan, schemas.CompletedPayment)
+job_queue.register("future_story", tui_suan, schemas.CompletedPayment)
+
+
+@router.post("/jobs")
+async def create_job(job: schemas.StoryJobCreate) -> schemas.StoryJob:
+    # an unknown session would only surface as a foreign key error on the job insert
+    payment_complete, _ = await async_database.check_payment(job.user_id, job.session_id, job.order_id)
+    if not payment_complete:
+        raise HTTPException(status_code=400, detail="Payment not found")
+    payload = schemas.CompletedPayment(user_id=job.user_id, order_id=job.order_id, session_id=job.session_id)
+    try:
+        created_job = await job_queue.enqueue(job.kind, job.session_id, payload.model_dump(mode="json"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return created_job
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> schemas.StoryJob:
+    job = await async_database.get_story_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from app.embedding_cache import embedding_cache
+from app.dependencies import wiki_store, past_story_cache_stats, past_story_fallback_stats, chat_flight, embed_flight, wiki_flight
+from app.jobs import job_queue
+from app.annotation import annotation_engine
+from app import transport, resilience, db_pool
+
+router = APIRouter(
+    prefix="/api",
+    tags=["metrics"]
+)
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return {
+        "embedding_cache": {**embedding_cache.stats, "memory_entries": len(embedding_cache.memory)},
+        "wiki_store": {**wiki_store.stats, "pages": len(wiki_store.offsets)},
+        "single_flight": {
+            "chat": {**chat_flight.stats, "in_flight": len(chat_flight.in_flight)},
+            "embed": {**embed_flight.stats, "in_flight": len(embed_flight.in_flight)},
+            "wiki": {**wiki_flight.stats, "in_flight": len(wiki_flight.in_flight)},
+        },
+        "past_story_cache": past_story_cache_stats,
+        "past_story_fallback": past_story_fallback_stats,
+        **resilience.stats(),
+        "http_pools": transport.pool_stats(),
+        **db_pool.stats(),
+        "annotation": annotation_engine.stats,
+        "story_jobs": {"queued": job_queue.queue.qsize(), "workers": len(job_queue.tasks)},
+    }
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
-from app import database, schemas, models
+from fastapi.responses import StreamingResponse
+from app import async_database, schemas, models
 import json
 import uuid
+import asyncio
 from app import dependencies
 
 
@@ -10,9 +12,11 @@ router = APIRouter(
     tags=["story"]
 )
 
+FUTURE_STORY_MODEL = "gpt-4o-mini"
+
 @router.post("/test")
 async def test(completed_payment: schemas.CompletedPayment):
-    check = database.check_payment(completed_payment.user_id, completed_payment.session_id, completed_payment.order_id)
+    check = await async_database.check_payment(completed_payment.user_id, completed_payment.session_id, completed_payment.order_id)
     return check
     
 
@@ -21,20 +25,20 @@ async def test(completed_payment: schemas.CompletedPayment):
 async def get_stories(story_id: int | None = None, user_id: int | None = None) -> list[schemas.GeneratedStory]:
     assert story_id or user_id, "Either story_id or user_id must be provided"
     if story_id:
-        story = database.get_story_by_story_id(story_id)
+        story = await async_database.get_story_by_story_id(story_id)
         return [story]
     elif user_id:
-        stories = database.get_all_stories_by_user_id(user_id)
+        stories = await async_database.get_all_stories_by_user_id(user_id)
         return stories
 
 @router.delete("/story")
-async def get_stories(story_id: int ):
-   return database.delete_story(story_id)
+async def get_stories(story_id: int):
+   return await async_database.delete_story(story_id)
 
 
 @router.post('/yunsuan')
 async def yun_suan(payment_token: schemas.CompletedPayment) -> schemas.TempStory:
-    payment_complete, lack = database.check_payment(payment_token.user_id, 
+    payment_complete, lack = await async_database.check_payment(payment_token.user_id, 
                                  payment_token.session_id, 
                                  payment_token.order_id)
 
@@ -45,46 +49,37 @@ async def yun_suan(payment_token: schemas.CompletedPayment) -> schemas.TempStory
     elif lack != "past_story":
         raise HTTPException(status_code=400, detail=f"Temp story already generated, generate future story instead - go to /api/tuisuan endpoint")
 
-    user = database.get_user_by_id(payment_token.user_id)
+    user = await async_database.get_user_by_id(payment_token.user_id)
     user = schemas.Users(**user)
     user_str = json.dumps(user.model_dump(mode="json"))
     
-    sbert_call_transaction_id = uuid.uuid4()
-    sbert_call = database.record_sbert_call(sbert_call_transaction_id, payment_token.session_id, user_str)
-    past_story_text = dependencies.generate_past_story(user_str)
-      
-    ##get biography    
-
-    _ = database.insert_past_story(sbert_call_transaction_id, past_story_text)
-    past_story = database.get_past_story(_["story_id"])
-    past_story = schemas.TempStory(**past_story)
-    
-    #do a sbert call
+    # upstream calls first and every write in one transaction at the end, so a job retry
+    # after a failed lookup finds the session untouched instead of a half-written story
+    past_story_text = await dependencies.generate_past_story(user_str)
 
-    #find referennce
-    matches = dependencies.get_similar_stories(past_story_text, 5)
-    matches =sorted(matches, key=lambda x: x["score"], reverse=True)
+    #find referennce, one entry per figure however many paragraphs matched it, best first
+    matches = await dependencies.get_similar_stories(past_story_text, 5)
     
-    #filter for human
-    wiki_references_ids = []
-    similarity_scores = []
-    for match in matches:
-        page = dependencies.wiki.page(match["metadata"]["title"])
-        if dependencies.filter_for_human(page):
-            wiki_reference = database.insert_wiki_reference(match["id"], match["metadata"]["text"], match["metadata"]["url"], match["metadata"]["title"])
-            wiki_references_ids.append(match["id"])
-            similarity_scores.append(match["score"])
-    
-    #record identified relationships
-    identified_relationships = database.record_identified_relationships(past_story.story_id, wiki_references_ids, similarity_scores)
+    #filter for human, already done inside the vector query when the index carries is_person
+    if dependencies.PERSON_FILTER:
+        human_matches = matches
+    else:
+        pages = await asyncio.gather(*[dependencies.get_wiki_page(match["metadata"]["title"]) for match in matches])
+        human_matches = [match for match, page in zip(matches, pages) if dependencies.filter_for_human(page)]
+
+    references = [
+        (match["id"], match["metadata"]["text"], match["metadata"]["url"], match["metadata"]["title"], match["similarity"])
+        for match in human_matches
+    ]
+    past_story = await async_database.record_past_story(uuid.uuid4(), payment_token.session_id, user_str, past_story_text, references)
+    past_story = schemas.TempStory(**past_story)
     
     return past_story
 
     
 
-@router.post("/tuisuan")
-async def tui_suan(payment_token: schemas.CompletedPayment) -> schemas.DisplayStory:
-    payment_complete, lack = database.check_payment(payment_token.user_id, 
+async def prepare_future_story(payment_token: schemas.CompletedPayment):
+    payment_complete, lack = await async_database.check_payment(payment_token.user_id, 
                                  payment_token.session_id, 
                                  payment_token.order_id)
 
@@ -106,39 +101,64 @@ async def tui_suan(payment_token: schemas.CompletedPayment) -> schemas.DisplaySt
     
     
     transaction_id = uuid.uuid4()
-    database.record_APICall(transaction_id, payment_token.session_id, system_prompt)
+    await async_database.record_APICall(transaction_id, payment_token.session_id, system_prompt)
 
-    wiki_references = database.get_identified_references_by_session_id(payment_token.session_id)
+    wiki_references = await async_database.get_identified_references_by_session_id(payment_token.session_id)
 
             
     wiki_references = [schemas.WikiReference(**r) for r in wiki_references]
-    wiki_references_texts, wiki_references_titles = dependencies.process_wiki_references(wiki_references)
     
-    
-    biography = database.get_past_story_by_session_id(payment_token.session_id)
+    biography = await async_database.get_past_story_by_session_id(payment_token.session_id)
     biography = schemas.TempStory(**biography)
+
+    wiki_references_texts, wiki_references_titles = await dependencies.process_wiki_references(wiki_references, biography.generated_story_text)
     
-    response = dependencies.open_ai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": "This is the biography of the person: " + biography.generated_story_text},
-            {"role": "user", "content": "These are the historical figures that are most similar to the person in question: " + wiki_references_texts}
-        ]
-    )
-    
-    
-    story_text = response.choices[0].message.content
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": "This is the biography of the person: " + biography.generated_story_text},
+        {"role": "user", "content": "These are the historical figures that are most similar to the person in question: " + wiki_references_texts}
+    ]
+    return transaction_id, messages, wiki_references_titles
+
+
+@router.post("/tuisuan")
+async def tui_suan(payment_token: schemas.CompletedPayment) -> schemas.DisplayStory:
+    transaction_id, messages, wiki_references_titles = await prepare_future_story(payment_token)
+
+    story_text = await dependencies.chat_completion("openai", FUTURE_STORY_MODEL, messages)
      
     #generate story
-    future_story = database.insert_future_story(transaction_id, story_text,wiki_references_titles)
+    future_story = await async_database.insert_future_story(transaction_id, story_text,wiki_references_titles)
     future_story = schemas.DisplayStory(**future_story)
     
     return future_story
 
 
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
+@router.post("/tuisuan/stream")
+async def tui_suan_stream(payment_token: schemas.CompletedPayment) -> StreamingResponse:
+    # validation and prompt building happen before the first byte so errors still come back as a plain 400
+    transaction_id, messages, wiki_references_titles = await prepare_future_story(payment_token)
 
+    async def story_events():
+        story_chunks = []
+        try:
+            async for chunk in dependencies.stream_chat_completion("openai", FUTURE_STORY_MODEL, messages):
+                story_chunks.append(chunk)
+                yield format_sse("token", {"text": chunk})
 
+            future_story = await async_database.insert_future_story(transaction_id, "".join(story_chunks), wiki_references_titles)
+            future_story = schemas.DisplayStory(**future_story)
+        except Exception as e:
+            yield format_sse("error", {"detail": str(e)})
+            return
+        yield format_sse("done", future_story.model_dump(mode="json"))
 
+    return StreamingResponse(
+        story_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException
 from typing import List
-from app import database, schemas
+from app import async_database, schemas
 
 router = APIRouter(
     prefix="/api/users",
@@ -12,7 +12,7 @@ router = APIRouter(
 @router.get("/{user_id}", response_model=schemas.Users)
 async def get_user(user_id: int) -> schemas.Users:
     try:
-        user = database.get_user_by_id(user_id)
+        user = await async_database.get_user_by_id(user_id)
         if user and not user.get('display_name'):
             user['display_name'] = "Anonymous User " +user['user_id']
         return user
@@ -23,7 +23,7 @@ async def get_user(user_id: int) -> schemas.Users:
 @router.put("/", response_model=schemas.Users)
 async def create_user(user: schemas.UserCreate) -> schemas.Users:
     try:
-        created_user = database.insert_user(user.dict())
+        created_user = await async_database.insert_user(user.dict())
         return created_user
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -33,7 +33,7 @@ async def update_user(user_id: int, user: schemas.UserCreate):
     try:
         user_data = user.model_dump()
         user_data['user_id'] = user_id  # Ensure user_id is in the dictionary
-        updated_user = database.update_user(user_data)
+        updated_user = await async_database.update_user(user_data)
         if not updated_user:
             raise HTTPException(status_code=404, detail="User not found or failed to update")
         return updated_user
@@ -43,7 +43,7 @@ async def update_user(user_id: int, user: schemas.UserCreate):
 @router.delete("/{user_id}")
 async def delete_user(user_id: int):
     try:
-        database.delete_user(user_id)
+        await async_database.delete_user(user_id)
         return {"message": "User deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -188,6 +188,20 @@ class PaymentRequest(IChingBaseModel):
     user_id: int
     order_id: int
     
+class StoryJobCreate(CompletedPayment):
+    kind: str #past_story or future_story
+
+class StoryJob(IChingBaseModel):
+    job_id: str
+    session_id: int
+    kind: str
+    status: str
+    attempts: int
+    result: dict | None = None
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
+
 class HistoricalSession(IChingBaseModel): 
     timestamp: datetime
     generated_story_text: str
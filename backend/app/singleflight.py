@@ -0,0 +1,73 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one in-flight future.
+
+    Callers that arrive while a call for their key is running await its result instead
+    of issuing their own request. Nothing is kept once the call finishes, so this is not
+    a cache, only deduplication of work that overlaps in time.
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def _register(self, key, future):
+        self.in_flight[key] = future
+
+        def forget(_):
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+        future.add_done_callback(forget)
+
+    async def do(self, key, fn):
+        """Return the result of fn(), sharing it with concurrent callers using the same key."""
+        self.stats["calls"] += 1
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._register(key, future)
+        else:
+            self.stats["coalesced"] += 1
+        # shield: a caller going away must not cancel the call the others are waiting on
+        return await asyncio.shield(future)
+
+    async def do_many(self, keys, fn):
+        """Batch form of do: fn(missing_keys) returns one result per key, in order, for the
+        keys nobody else is already fetching. Returns results aligned with keys."""
+        self.stats["calls"] += len(keys)
+        loop = asyncio.get_running_loop()
+        futures = {}
+        own = []
+        for key in dict.fromkeys(keys):
+            if key in self.in_flight:
+                futures[key] = self.in_flight[key]
+            else:
+                futures[key] = loop.create_future()
+                self._register(key, futures[key])
+                own.append(key)
+        self.stats["coalesced"] += sum(1 for key in keys if key not in own)
+
+        if own:
+            asyncio.ensure_future(self._resolve(own, [futures[key] for key in own], fn))
+        return list(await asyncio.shield(asyncio.gather(*[futures[key] for key in keys])))
+
+    @staticmethod
+    async def _resolve(keys, futures, fn):
+        try:
+            results = list(await fn(keys))
+            # zip would stop at the shorter list and leave the remaining callers waiting forever
+            if len(results) != len(keys):
+                raise ValueError(f"Expected {len(keys)} results, got {len(results)}")
+        except BaseException as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# One pooled, retrying HTTP transport per upstream service. The SDK clients in
+# app.providers are built on top of these instead of managing their own connections.
+#
+#   <SERVICE>_TIMEOUT       total request timeout in seconds, e.g. DEEPSEEK_TIMEOUT
+#   HTTP_MAX_CONNECTIONS    pool size per service
+#   HTTP_MAX_RETRIES        retries on connection errors, 429 and 5xx (POSTs: see below)
+#   HTTP_RETRY_BACKOFF      base delay in seconds for the jittered exponential backoff
+
+DEFAULT_TIMEOUTS = {"deepseek": 120.0, "openai": 120.0, "cohere": 30.0, "wikipedia": 10.0}
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.PoolTimeout)
+# a POST the upstream may already have processed (and billed) is only sent again when the
+# request never left the pool or the upstream said it did not take it
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+UNPROCESSED_STATUSES = frozenset([429, 503])
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+MAX_RETRY_AFTER = 30.0
+
+
+def timeout_for(service):
+    return float(os.getenv(f"{service.upper()}_TIMEOUT", DEFAULT_TIMEOUTS.get(service, 30.0)))
+
+
+def backoff_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER)
+    # full jitter: uniform over [0, base * 2^attempt]
+    return random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+
+
+def parse_retry_after(response):
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """Pooled keep-alive transport that retries connection errors and retryable statuses."""
+
+    def __init__(self, service, max_retries=MAX_RETRIES, max_connections=MAX_CONNECTIONS):
+        self.service = service
+        self.max_retries = max_retries
+        self.transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self.stats = {"requests": 0, "retries": 0, "errors": 0, "in_flight": 0}
+
+    async def handle_async_request(self, request):
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        idempotent = request.method in IDEMPOTENT_METHODS
+        retry_errors = RETRY_ERRORS if idempotent else UNSENT_ERRORS
+        retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+        try:
+            for attempt in range(self.max_retries + 1):
+                last_attempt = attempt == self.max_retries
+                try:
+                    response = await self.transport.handle_async_request(request)
+                except retry_errors as e:
+                    if last_attempt:
+                        self.stats["errors"] += 1
+                        raise
+                    logger.info("%s request failed (%s), retrying", self.service, e)
+                    delay = backoff_delay(attempt)
+                else:
+                    if response.status_code not in retry_statuses or last_attempt:
+                        if response.status_code >= 500:
+                            self.stats["errors"] += 1
+                        return response
+                    delay = backoff_delay(attempt, parse_retry_after(response))
+                    await response.aclose()
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+        finally:
+            self.stats["in_flight"] -= 1
+
+    def pool_stats(self):
+        connections = self.transport._pool.connections
+        return {
+            **self.stats,
+            "connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+        }
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+_clients = {}
+_sessions = {}
+
+
+def client(service):
+    """Shared httpx.AsyncClient for `service`, created on first use."""
+    if service not in _clients:
+        _clients[service] = httpx.AsyncClient(
+            transport=RetryTransport(service),
+            timeout=httpx.Timeout(timeout_for(service), connect=min(10.0, timeout_for(service))),
+        )
+    return _clients[service]
+
+
+def mount_requests_session(session, service):
+    """Pool and retry policy for libraries that are built on requests (wikipediaapi)."""
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        backoff_jitter=RETRY_BACKOFF,
+        status_forcelist=sorted(RETRY_STATUSES),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    stats = {"requests": 0, "errors": 0}
+
+    def count(response, *args, **kwargs):
+        stats["requests"] += 1
+        if response.status_code >= 500:
+            stats["errors"] += 1
+
+    session.hooks["response"].append(count)
+    _sessions[service] = (adapter, stats)
+
+
+def pool_stats():
+    stats = {service: c._transport.pool_stats() for service, c in _clients.items()}
+    for service, (adapter, counters) in _sessions.items():
+        pools = adapter.poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        stats[service] = {
+            **counters,
+            "pools": len(pools),
+            "connections_opened": sum(p.num_connections for p in pools),
+        }
+    return stats
+
+
+async def aclose():
+    for c in _clients.values():
+        await c.aclose()
+    _clients.clear()
@@ -0,0 +1,173 @@
+"""Local vector search over an exported copy of the wiki reference index.
+
+An index directory holds
+    vectors.npy     float32 matrix, one row per reference, L2-normalized for the cosine metric
+    metadata.jsonl  {"id", "metadata"} per row, same order as vectors.npy
+    index.json      {"metric", "dim", "count"}
+    hnsw.bin        optional hnswlib graph for the approximate mode (poetry install --extras ann)
+
+vectors.npy is opened with mmap_mode="r", so every worker on a box shares one copy
+through the page cache.
+
+    python -m app.vector_index export <dir> [--metric cosine] [--hnsw]
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+class VectorIndex:
+    def __init__(self, path, mode="exact", ef=64):
+        with open(os.path.join(path, "index.json")) as f:
+            info = json.load(f)
+        self.metric = info["metric"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.ids = []
+        self.metadata = []
+        with open(os.path.join(path, "metadata.jsonl")) as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.metadata.append(record["metadata"])
+        self.positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        self.masks = {}
+        self.mode = mode
+        self.graph = None
+        if mode == "hnsw":
+            self.graph = load_hnsw(path, self.vectors, self.metric)
+            self.graph.set_ef(ef)
+        elif mode != "exact":
+            raise ValueError(f"Unknown vector index mode {mode}")
+
+    def filter_mask(self, query_filter):
+        # filters are few and repeat on every query, so the row masks are computed once
+        key = json.dumps(query_filter, sort_keys=True)
+        if key not in self.masks:
+            self.masks[key] = np.array([matches_filter(m, query_filter) for m in self.metadata], dtype=bool)
+        return self.masks[key]
+
+    def query(self, vector, top_k, query_filter=None):
+        query = np.asarray(vector, dtype=np.float32)
+        if self.metric == "cosine":
+            query = query / max(np.linalg.norm(query), 1e-12)
+        mask = self.filter_mask(query_filter) if query_filter else None
+        if self.graph is not None:
+            rows, scores = self._query_hnsw(query, top_k, mask)
+        else:
+            rows, scores = self._query_exact(query, top_k, mask)
+        return [
+            {"id": self.ids[i], "score": float(score), "metadata": self.metadata[i]}
+            for i, score in zip(rows, scores)
+        ]
+
+    def _query_exact(self, query, top_k, mask):
+        # argpartition needs 0 <= top_k - 1 < candidates, so an empty index or filter returns early
+        allowed = int(mask.sum()) if mask is not None else len(self.ids)
+        top_k = min(top_k, allowed)
+        if top_k == 0:
+            return [], []
+        scores = self.vectors @ query
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        rows = np.argpartition(-scores, top_k - 1)[:top_k]
+        rows = rows[np.argsort(-scores[rows])]
+        return rows, scores[rows]
+
+    def _query_hnsw(self, query, top_k, mask):
+        allowed = int(mask.sum()) if mask is not None else len(self.ids)
+        top_k = min(top_k, allowed)
+        if top_k == 0:
+            return [], []
+        labels, distances = self.graph.knn_query(
+            query, k=top_k, filter=(lambda label: bool(mask[label])) if mask is not None else None
+        )
+        # hnswlib reports distances: 1 - similarity for cosine and inner product
+        return labels[0], 1.0 - distances[0]
+
+    def list_ids(self, batch_size=100):
+        for start in range(0, len(self.ids), batch_size):
+            yield self.ids[start:start + batch_size]
+
+    def fetch_metadata(self, ids):
+        return {vector_id: self.metadata[self.positions[vector_id]] for vector_id in ids if vector_id in self.positions}
+
+
+def matches_filter(metadata, query_filter):
+    # the subset of the Pinecone filter language the app uses: {"field": {"$eq": value}}
+    for field, condition in (query_filter or {}).items():
+        expected = condition.get("$eq") if isinstance(condition, dict) else condition
+        if metadata.get(field) != expected:
+            return False
+    return True
+
+
+def require_hnswlib():
+    if hnswlib is None:
+        raise ImportError("The hnsw vector index mode needs hnswlib, install the ann extra: `poetry install --extras ann`")
+
+
+def build_hnsw(vectors, metric, m=16, ef_construction=200):
+    require_hnswlib()
+    graph = hnswlib.Index(space="cosine" if metric == "cosine" else "ip", dim=vectors.shape[1])
+    graph.init_index(max_elements=len(vectors), M=m, ef_construction=ef_construction)
+    graph.add_items(vectors, np.arange(len(vectors)))
+    return graph
+
+
+def load_hnsw(path, vectors, metric):
+    require_hnswlib()
+    graph_path = os.path.join(path, "hnsw.bin")
+    if not os.path.exists(graph_path):
+        build_hnsw(vectors, metric).save_index(graph_path)
+    graph = hnswlib.Index(space="cosine" if metric == "cosine" else "ip", dim=vectors.shape[1])
+    graph.load_index(graph_path, max_elements=len(vectors))
+    return graph
+
+
+def write_index(path, ids, vectors, metadata, metric="cosine", hnsw=False):
+    os.makedirs(path, exist_ok=True)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if metric == "cosine":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    with open(os.path.join(path, "metadata.jsonl"), "w") as f:
+        for vector_id, vector_metadata in zip(ids, metadata):
+            f.write(json.dumps({"id": vector_id, "metadata": vector_metadata}) + "\n")
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump({"metric": metric, "dim": vectors.shape[1], "count": len(ids)}, f)
+    graph_path = os.path.join(path, "hnsw.bin")
+    if os.path.exists(graph_path):
+        os.remove(graph_path)
+    if hnsw:
+        build_hnsw(vectors, metric).save_index(graph_path)
+
+
+def export_index(path, source, metric="cosine", hnsw=False, batch_size=100):
+    """Copy every vector of `source` (a provider with list_ids/fetch_vectors) into an index directory."""
+    ids, vectors, metadata = [], [], []
+    for batch in source.list_ids(batch_size):
+        for vector_id, (values, vector_metadata) in source.fetch_vectors(batch).items():
+            ids.append(vector_id)
+            vectors.append(values)
+            metadata.append(vector_metadata)
+    write_index(path, ids, vectors, metadata, metric=metric, hnsw=hnsw)
+    return len(ids)
+
+
+if __name__ == "__main__":
+    from app import providers
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("path")
+    parser.add_argument("--metric", choices=["cosine", "dotproduct"], default="cosine")
+    parser.add_argument("--hnsw", action="store_true", help="also build the approximate search graph")
+    args = parser.parse_args()
+    count = export_index(args.path, providers.remote_vector(), metric=args.metric, hnsw=args.hnsw)
+    print(f"Exported {count} vectors to {args.path}.")
@@ -0,0 +1,206 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from app.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# md5(title), offset into pages.dat, record length, fetched_at (unix time)
+INDEX_RECORD = struct.Struct("<16sQId")
+
+
+class WikiPageStore:
+    """Persistent, append-only store of Wikipedia page snapshots keyed by title.
+
+    Pages (title, categories and nested sections) are zlib-compressed JSON records
+    appended to pages.dat. pages.idx is a flat array of fixed-size INDEX_RECORDs that
+    is read incrementally; the latest record for a title wins, so refreshing a page is
+    just another append. Several workers can share the same directory, writers take an
+    exclusive flock on pages.lock. compact() drops the superseded records by swapping in
+    rewritten files; each worker keeps its open pair until it notices the new pages.idx.
+    Disk reads run in worker threads, which share the open files under self.lock.
+    """
+
+    def __init__(self, path, loader, ttl=30 * 24 * 3600, flight=None):
+        self.path = path
+        self.loader = loader
+        self.flight = flight or SingleFlight()
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
+        self.data_path = os.path.join(path, "pages.dat")
+        self.index_path = os.path.join(path, "pages.idx")
+        self.lock_path = os.path.join(path, "pages.lock")
+        for p in (self.data_path, self.index_path, self.lock_path):
+            open(p, "ab").close()
+        self.offsets = {}
+        self.index_size = 0
+        self.index_file = None
+        self.data_file = None
+        self.data_map = None
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "fetch_errors": 0}
+        # flock only excludes other processes, this keeps our own threads off the files being swapped
+        self.lock = threading.RLock()
+        self._read_index()
+
+    @staticmethod
+    def key(title):
+        return hashlib.md5(title.encode("utf-8")).digest()
+
+    def _open_files(self):
+        # under a shared lock so a compaction can't swap the files between the two opens
+        with open(self.lock_path, "rb") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            self.close()
+            self.index_file = open(self.index_path, "rb")
+            self.data_file = open(self.data_path, "rb")
+        self.offsets = {}
+        self.index_size = 0
+
+    def _read_index(self):
+        with self.lock:
+            if self.index_file is None or os.fstat(self.index_file.fileno()).st_ino != os.stat(self.index_path).st_ino:
+                self._open_files()
+            size = os.fstat(self.index_file.fileno()).st_size
+            size -= size % INDEX_RECORD.size  # ignore a record another worker is still writing
+            if size <= self.index_size:
+                return
+            records = os.pread(self.index_file.fileno(), size - self.index_size, self.index_size)
+            for digest, offset, length, fetched_at in INDEX_RECORD.iter_unpack(records):
+                self.offsets[digest] = (offset, length, fetched_at)
+            self.index_size = size
+
+    def _read_record(self, offset, length):
+        if self.data_map is None or offset + length > len(self.data_map):
+            if self.data_map is not None:
+                self.data_map.close()
+            self.data_map = mmap.mmap(self.data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return json.loads(zlib.decompress(self.data_map[offset:offset + length]))
+
+    def lookup(self, title, reread=False):
+        """Return (page, fetched_at) from disk, or (None, None) if the title was never stored.
+        Blocking, call it from a thread on the event loop."""
+        digest = self.key(title)
+        with self.lock:
+            if reread or digest not in self.offsets:
+                self._read_index()
+            entry = self.offsets.get(digest)
+            if entry is None:
+                return None, None
+            offset, length, fetched_at = entry
+            page = self._read_record(offset, length)
+        if page.get("requested_title") != title:
+            return None, None
+        return page, fetched_at
+
+    def put(self, title, page):
+        record = zlib.compress(json.dumps({**page, "requested_title": title}).encode("utf-8"))
+        fetched_at = time.time()
+        with self.lock:
+            with open(self.lock_path, "rb") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                with open(self.data_path, "ab") as data_file, open(self.index_path, "ab") as index_file:
+                    data_file.seek(0, os.SEEK_END)
+                    offset = data_file.tell()
+                    data_file.write(record)
+                    data_file.flush()
+                    index_file.write(INDEX_RECORD.pack(self.key(title), offset, len(record), fetched_at))
+                    index_file.flush()
+            # picks up the new record, and the new files if a compaction swapped them in meanwhile;
+            # after the flock is released, _open_files takes its own shared one
+            self._read_index()
+
+    def compact(self):
+        """Rewrite pages.dat and pages.idx with only the latest record per title,
+        return the number of bytes reclaimed."""
+        data_tmp, index_tmp = self.data_path + ".compact", self.index_path + ".compact"
+        with self.lock:
+            with open(self.lock_path, "rb") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                with open(self.data_path, "rb") as data_file, open(self.index_path, "rb") as index_file:
+                    index = index_file.read()
+                    latest = {}
+                    for digest, offset, length, fetched_at in INDEX_RECORD.iter_unpack(index[:len(index) - len(index) % INDEX_RECORD.size]):
+                        latest[digest] = (offset, length, fetched_at)
+                    old_size = os.fstat(data_file.fileno()).st_size
+                    with open(data_tmp, "wb") as new_data, open(index_tmp, "wb") as new_index:
+                        for digest, (offset, length, fetched_at) in latest.items():
+                            new_index.write(INDEX_RECORD.pack(digest, new_data.tell(), length, fetched_at))
+                            new_data.write(os.pread(data_file.fileno(), length, offset))
+                        for f in (new_data, new_index):
+                            f.flush()
+                            os.fsync(f.fileno())
+                # data first: a reader only switches once it sees the new index, under the shared lock
+                os.replace(data_tmp, self.data_path)
+                os.replace(index_tmp, self.index_path)
+                new_size = os.path.getsize(self.data_path)
+            # our own open pair is still the old one, swap it before another thread reads through it
+            self._read_index()
+        return old_size - new_size
+
+    def close(self):
+        with self.lock:
+            for f in (self.data_map, self.index_file, self.data_file):
+                if f is not None:
+                    f.close()
+            self.data_map = self.index_file = self.data_file = None
+
+    async def get(self, title):
+        page, fetched_at = await asyncio.to_thread(self.lookup, title)
+        if page is not None and time.time() - fetched_at >= self.ttl:
+            # another worker may have refreshed it since the index was last read
+            page, fetched_at = await asyncio.to_thread(self.lookup, title, True)
+        if page is not None and time.time() - fetched_at < self.ttl:
+            self.stats["hits"] += 1
+            return page
+        self.stats["stale" if page is not None else "misses"] += 1
+        try:
+            return await self._fetch(title)
+        except Exception as e:
+            if page is None:
+                raise
+            logger.warning("Refreshing wiki page %r failed, serving stale copy: %s", title, e)
+            self.stats["fetch_errors"] += 1
+            return page
+
+    async def _fetch(self, title):
+        # concurrent misses for the same title share one download
+        return await self.flight.do(title, lambda: self._download(title))
+
+    async def _download(self, title):
+        page = await asyncio.to_thread(self.loader, title)
+        await asyncio.to_thread(self.put, title, page)
+        return page
+
+    async def prewarm(self, titles, concurrency=8):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def warm(title):
+            async with semaphore:
+                try:
+                    await self.get(title)
+                except Exception as e:
+                    logger.warning("Could not prewarm wiki page %r: %s", title, e)
+
+        await asyncio.gather(*[warm(title) for title in dict.fromkeys(titles)])
+
+
+if __name__ == "__main__":
+    from app import async_database, dependencies
+
+    async def prewarm_references():
+        await dependencies.wiki_store.prewarm(await async_database.get_wiki_reference_titles())
+        await async_database.dispose()
+
+    asyncio.run(prewarm_references())
+    print(f"Prewarmed {len(dependencies.wiki_store.offsets)} wiki pages.")
+    # refreshes append, so this is where the superseded copies get dropped
+    print(f"Compacted the wiki store, reclaimed {dependencies.wiki_store.compact()} bytes.")
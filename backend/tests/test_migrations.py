@@ -0,0 +1,89 @@
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy import create_engine, text
+
+from app import migrations
+from app.models import Base
+
+# a scratch database the tests may create tables in and migrate back and forth
+TEST_DB_URI = os.getenv("TEST_DB_URI")
+
+
+def fake_migration(version):
+    return SimpleNamespace(version=version, description=f"step {version}", transactional=True,
+                           upgrade=f"upgrade {version}", downgrade=f"downgrade {version}")
+
+
+class MigrationOrderTest(unittest.TestCase):
+    def test_versions_are_contiguous_and_ascending(self):
+        versions = [migration.version for migration in migrations.MIGRATIONS]
+        self.assertEqual(versions, list(range(1, len(versions) + 1)))
+
+    def test_every_step_can_be_reverted(self):
+        for migration in migrations.MIGRATIONS:
+            self.assertTrue(migration.description)
+            self.assertIsInstance(migration.transactional, bool)
+            self.assertTrue(callable(migration.upgrade))
+            self.assertTrue(callable(migration.downgrade))
+
+    def run_with(self, fn, applied, *args):
+        steps = []
+        with mock.patch.object(migrations, "MIGRATIONS", [fake_migration(v) for v in (1, 2, 3)]), \
+                mock.patch.object(migrations, "_locked", lambda engine, apply: apply(set(applied))), \
+                mock.patch.object(migrations, "_run", lambda engine, migration, step, record: steps.append(step)), \
+                mock.patch("builtins.print"):
+            done = fn(None, *args)
+        return done, steps
+
+    def test_upgrade_applies_pending_steps_in_order(self):
+        self.assertEqual(self.run_with(migrations.upgrade, {2}), ([1, 3], ["upgrade 1", "upgrade 3"]))
+
+    def test_upgrade_stops_at_target(self):
+        self.assertEqual(self.run_with(migrations.upgrade, set(), 2), ([1, 2], ["upgrade 1", "upgrade 2"]))
+
+    def test_downgrade_reverts_newest_first(self):
+        self.assertEqual(self.run_with(migrations.downgrade, {1, 2, 3}, 1), ([3, 2], ["downgrade 3", "downgrade 2"]))
+
+    def test_downgrade_skips_steps_never_applied(self):
+        self.assertEqual(self.run_with(migrations.downgrade, {1, 3}, 0), ([3, 1], ["downgrade 3", "downgrade 1"]))
+
+
+@unittest.skipUnless(TEST_DB_URI, "set TEST_DB_URI to a scratch Postgres database")
+class MigrationDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(TEST_DB_URI)
+        self.addCleanup(self.engine.dispose)
+        Base.metadata.create_all(self.engine)
+        with mock.patch("builtins.print"):
+            migrations.upgrade(self.engine)
+
+    def indexes(self):
+        with self.engine.connect() as conn:
+            return {row[0] for row in conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = 'public'"))}
+
+    def applied(self):
+        return [version for version, _, applied in migrations.status(self.engine) if applied]
+
+    def test_downgrade_and_upgrade_round_trip(self):
+        latest = migrations.MIGRATIONS[-1].version
+        self.assertEqual(self.applied(), list(range(1, latest + 1)))
+        self.assertIn("ix_events_user_id", self.indexes())
+
+        with mock.patch("builtins.print"):
+            self.assertEqual(migrations.downgrade(self.engine, 1), list(range(latest, 1, -1)))
+        self.assertEqual(self.applied(), [1])
+        self.assertNotIn("ix_events_user_id", self.indexes())
+        self.assertNotIn("uq_story_jobs_session_kind", self.indexes())
+
+        with mock.patch("builtins.print"):
+            self.assertEqual(migrations.upgrade(self.engine), list(range(2, latest + 1)))
+            self.assertEqual(migrations.upgrade(self.engine), [])
+        self.assertEqual(self.applied(), list(range(1, latest + 1)))
+        self.assertTrue({"ix_events_user_id", "uq_story_jobs_session_kind"} <= self.indexes())
+
+
+if __name__ == "__main__":
+    unittest.main()
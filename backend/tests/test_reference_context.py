@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+
+from app.reference_context import build_reference_context, estimate_tokens, pack_sections, rank_sections, split_sections
+
+
+def section(title, text, sections=()):
+    return {"title": title, "text": text, "sections": list(sections)}
+
+
+class SplitSectionsTest(unittest.TestCase):
+    def test_flattens_nested_sections_and_stops_at_references(self):
+        sections = [
+            section("Early life", "Born in a village.", [section("Education", "Studied law.")]),
+            section("Empty", "  "),
+            section("References", "[1] A book."),
+            section("Legacy", "Never reached."),
+        ]
+        self.assertEqual(split_sections(sections), [
+            (0, "Early life", "Born in a village."),
+            (1, "Education", "Studied law."),
+        ])
+
+
+class PackSectionsTest(unittest.TestCase):
+    def test_highest_scores_that_fit_in_page_order(self):
+        sections = ["a" * 40, "b" * 40, "c" * 40, "d" * 40]  # 11 tokens each
+        packed = pack_sections(sections, [0.1, 0.9, 0.5, 0.8], token_budget=30)
+        self.assertEqual(packed, ["b" * 40, "d" * 40])
+
+    def test_skips_a_large_section_for_smaller_ones_that_fit(self):
+        sections = ["a" * 40, "b" * 400, "c" * 40]
+        packed = pack_sections(sections, [0.9, 0.8, 0.1], token_budget=25)
+        self.assertEqual(packed, ["a" * 40, "c" * 40])
+
+    def test_best_section_over_budget_is_truncated(self):
+        packed = pack_sections(["a" * 400, "b" * 400], [0.9, 0.1], token_budget=10)
+        self.assertEqual(packed, ["a" * 40])
+
+    def test_stays_within_budget(self):
+        rng = np.random.default_rng(0)
+        sections = ["x" * int(n) for n in rng.integers(10, 300, 50)]
+        packed = pack_sections(sections, rng.random(50), token_budget=500)
+        self.assertLessEqual(sum(estimate_tokens(text) for text in packed), 500)
+
+
+class RankSectionsTest(unittest.TestCase):
+    def test_cosine_similarity_to_the_query(self):
+        scores = rank_sections([1, 0], [[2, 0], [0, 3], [1, 1]])
+        np.testing.assert_allclose(scores, [1.0, 0.0, np.sqrt(0.5)], rtol=1e-6)
+
+
+class BuildReferenceContextTest(unittest.IsolatedAsyncioTestCase):
+    async def test_each_page_gets_its_share_of_the_budget(self):
+        # the biography points along x, so sections mentioning "war" rank first
+        async def embed(texts):
+            return [[1.0, 0.0] if "war" in text or text == "biography" else [0.0, 1.0] for text in texts]
+
+        pages = [
+            {"sections": [section("Childhood", "c" * 200), section("War", "war " * 50)]},
+            {"sections": [section("References", "skipped")]},
+            {"sections": [section("Career", "war " * 10), section("Family", "f" * 300)]},
+        ]
+        context = await build_reference_context("biography", pages, token_budget=150, embed=embed)
+        lines = context.strip().split("\n")
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith("*: War - war"))
+        self.assertTrue(lines[1].startswith("*: Career - war"))
+        self.assertTrue(all(estimate_tokens(line) <= 75 for line in lines))
+
+    async def test_no_usable_sections(self):
+        async def embed(texts):
+            raise AssertionError("nothing to embed")
+
+        pages = [{"sections": [section("See also", "Other people")]}]
+        self.assertEqual(await build_reference_context("biography", pages, token_budget=100, embed=embed), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from app.resilience import CircuitBreaker, CircuitOpenError, Hedger, size_bucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ClientError(Exception):
+    status_code = 400
+
+
+async def succeed():
+    return "ok"
+
+
+async def fail():
+    raise RuntimeError("down")
+
+
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        # only the module's own clock, the event loop keeps the real one
+        for patcher in (mock.patch("app.resilience.time", mock.Mock(monotonic=self.clock)),
+                        mock.patch("app.resilience.logger")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("test", failure_threshold=3, slow_call_seconds=5, reset_seconds=30)
+
+    async def trip(self):
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                await self.breaker.call(fail)
+
+    async def test_opens_after_consecutive_failures(self):
+        await self.trip()
+        self.assertEqual(self.breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            await self.breaker.call(succeed)
+        self.assertEqual(self.breaker.stats["rejected"], 1)
+
+    async def test_success_resets_the_failure_count(self):
+        for fn in (fail, fail, succeed, fail, fail):
+            try:
+                await self.breaker.call(fn)
+            except RuntimeError:
+                pass
+        self.assertEqual(self.breaker.state, "closed")
+
+    async def test_half_open_probe_success_closes(self):
+        await self.trip()
+        self.clock.now += 30
+        self.assertEqual(self.breaker.state, "half_open")
+        self.assertEqual(await self.breaker.call(succeed), "ok")
+        self.assertEqual(self.breaker.state, "closed")
+
+    async def test_half_open_probe_failure_reopens(self):
+        await self.trip()
+        self.clock.now += 30
+        with self.assertRaises(RuntimeError):
+            await self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.stats["opened"], 2)
+
+    async def test_half_open_lets_one_probe_through(self):
+        await self.trip()
+        self.clock.now += 30
+        release = asyncio.Event()
+
+        async def wait():
+            await release.wait()
+            return "ok"
+
+        probe = asyncio.ensure_future(self.breaker.call(wait))
+        await asyncio.sleep(0)
+        with self.assertRaises(CircuitOpenError):
+            await self.breaker.call(succeed)
+        release.set()
+        self.assertEqual(await probe, "ok")
+        self.assertEqual(self.breaker.state, "closed")
+
+    async def test_cancelled_probe_frees_the_slot(self):
+        await self.trip()
+        self.clock.now += 30
+        probe = asyncio.ensure_future(self.breaker.call(asyncio.Event().wait))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await probe
+        self.assertEqual(await self.breaker.call(succeed), "ok")
+
+    async def test_slow_calls_count_as_failures(self):
+        async def slow():
+            self.clock.now += 6
+            return "late"
+
+        for _ in range(3):
+            self.assertEqual(await self.breaker.call(slow), "late")
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.stats["slow_calls"], 3)
+
+    async def test_client_errors_do_not_open(self):
+        async def bad_request():
+            raise ClientError()
+
+        for _ in range(5):
+            with self.assertRaises(ClientError):
+                await self.breaker.call(bad_request)
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertEqual(self.breaker.stats["failures"], 0)
+
+
+class HedgerTest(unittest.IsolatedAsyncioTestCase):
+    def warm(self, hedger, latency, size=1, samples=20):
+        for _ in range(samples):
+            hedger.record(size, latency)
+
+    async def test_no_hedging_before_min_samples(self):
+        hedger = Hedger("test", percentile=95, min_samples=20)
+        self.warm(hedger, 0.01, samples=19)
+        self.assertIsNone(hedger.delay())
+
+    async def test_slow_primary_is_hedged_and_the_hedge_wins(self):
+        hedger = Hedger("test", percentile=95, min_samples=20)
+        self.warm(hedger, 0.02)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(1.0 if len(calls) == 1 else 0.01)
+            return len(calls)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.assertEqual(await hedger.run(call), 2)
+        self.assertLess(loop.time() - started, 0.5)
+        self.assertEqual(hedger.stats, {"calls": 1, "hedged": 1, "hedge_wins": 1})
+        # the winner's own latency is recorded, not the time since the primary started
+        self.assertLess(hedger.latencies[1][-1], 0.02)
+
+    async def test_fast_primary_is_not_hedged(self):
+        hedger = Hedger("test", percentile=95, min_samples=20)
+        self.warm(hedger, 0.2)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            return "ok"
+
+        self.assertEqual(await hedger.run(call), "ok")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(hedger.stats["hedged"], 0)
+
+    async def test_failed_primary_falls_back_to_the_hedge(self):
+        hedger = Hedger("test", percentile=95, min_samples=20)
+        self.warm(hedger, 0.01)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(0.05)
+                raise RuntimeError("down")
+            await asyncio.sleep(0.1)
+            return "hedge"
+
+        self.assertEqual(await hedger.run(call), "hedge")
+
+    async def test_batch_sizes_have_their_own_delay(self):
+        hedger = Hedger("test", percentile=95, min_samples=20)
+        self.warm(hedger, 0.01, size=1)
+        self.warm(hedger, 0.5, size=100)
+        self.assertAlmostEqual(hedger.delay(1), 0.01)
+        self.assertAlmostEqual(hedger.delay(100), 0.5)
+        self.assertAlmostEqual(hedger.delay(128), 0.5)
+        self.assertIsNone(hedger.delay(129))
+
+    def test_size_buckets(self):
+        self.assertEqual([size_bucket(size) for size in (0, 1, 2, 3, 4, 5, 100, 128, 129)],
+                         [1, 1, 2, 4, 4, 8, 128, 128, 256])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import unittest
+
+from app.singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "page"
+
+        results = await asyncio.gather(*[flight.do("title", fetch) for _ in range(5)])
+        self.assertEqual(results, ["page"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats, {"calls": 5, "coalesced": 4})
+        self.assertEqual(flight.in_flight, {})
+
+    async def test_sequential_calls_are_not_cached(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(await flight.do("title", fetch), 1)
+        self.assertEqual(await flight.do("title", fetch), 2)
+
+    async def test_error_reaches_every_caller(self):
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("down")
+
+        results = await asyncio.gather(*[flight.do("title", fetch) for _ in range(3)], return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(flight.in_flight, {})
+
+    async def test_cancelled_caller_does_not_cancel_the_others(self):
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "page"
+
+        first = asyncio.ensure_future(flight.do("title", fetch))
+        second = asyncio.ensure_future(flight.do("title", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        self.assertEqual(await second, "page")
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+    async def test_do_many_only_sends_keys_not_in_flight(self):
+        flight = SingleFlight()
+        batches = []
+
+        async def embed(keys):
+            batches.append(list(keys))
+            await asyncio.sleep(0.01)
+            return [key.upper() for key in keys]
+
+        results = await asyncio.gather(
+            flight.do_many(["a", "b"], embed),
+            flight.do_many(["b", "c", "c"], embed),
+        )
+        self.assertEqual(results, [["A", "B"], ["B", "C", "C"]])
+        self.assertEqual(batches, [["a", "b"], ["c"]])
+        self.assertEqual(flight.in_flight, {})
+
+    async def test_do_many_fails_every_key_on_short_result(self):
+        flight = SingleFlight()
+
+        async def embed(keys):
+            return ["only one"]
+
+        with self.assertRaises(ValueError):
+            await asyncio.wait_for(flight.do_many(["a", "b"], embed), 1)
+        self.assertEqual(flight.in_flight, {})
+
+    async def test_do_many_cancelled_caller_leaves_the_batch_running(self):
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def embed(keys):
+            await release.wait()
+            return [key.upper() for key in keys]
+
+        first = asyncio.ensure_future(flight.do_many(["a"], embed))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do_many(["a"], embed))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        self.assertEqual(await second, ["A"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from app.vector_index import VectorIndex, hnswlib, matches_filter, write_index
+
+
+class ExactVectorIndexTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(50, 8)).astype(np.float32)
+        self.ids = [f"ref-{i}" for i in range(50)]
+        self.metadata = [{"title": f"Figure {i}", "is_person": i % 2 == 0} for i in range(50)]
+        write_index(self.path, self.ids, self.vectors, self.metadata)
+        self.index = VectorIndex(self.path)
+
+    def brute_force(self, query, rows):
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        scores = normalized[rows] @ (query / np.linalg.norm(query))
+        return [self.ids[rows[i]] for i in np.argsort(-scores)]
+
+    def test_top_k_matches_brute_force(self):
+        query = self.vectors[7] + 0.1
+        results = self.index.query(query, 5)
+        self.assertEqual([r["id"] for r in results], self.brute_force(query, list(range(50)))[:5])
+        self.assertEqual(results[0]["metadata"], self.metadata[int(results[0]["id"].split("-")[1])])
+        scores = [r["score"] for r in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_top_k_with_filter(self):
+        query = self.vectors[3]
+        results = self.index.query(query, 5, {"is_person": {"$eq": True}})
+        people = [i for i in range(50) if i % 2 == 0]
+        self.assertEqual([r["id"] for r in results], self.brute_force(query, people)[:5])
+        self.assertTrue(all(r["metadata"]["is_person"] for r in results))
+
+    def test_filter_with_fewer_matches_than_k(self):
+        results = self.index.query(self.vectors[0], 5, {"title": "Figure 4"})
+        self.assertEqual([r["id"] for r in results], ["ref-4"])
+
+    def test_filter_without_matches(self):
+        self.assertEqual(self.index.query(self.vectors[0], 5, {"title": "Nobody"}), [])
+
+    def test_k_larger_than_the_index(self):
+        self.assertEqual(len(self.index.query(self.vectors[0], 500)), 50)
+
+    def test_empty_index(self):
+        with tempfile.TemporaryDirectory() as path:
+            write_index(path, [], np.zeros((0, 8), dtype=np.float32), [])
+            index = VectorIndex(path)
+            self.assertEqual(index.query(self.vectors[0], 5), [])
+            self.assertEqual(index.query(self.vectors[0], 5, {"is_person": True}), [])
+
+    def test_fetch_metadata(self):
+        self.assertEqual(self.index.fetch_metadata(["ref-1", "missing"]), {"ref-1": self.metadata[1]})
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            VectorIndex(self.path, mode="ivf")
+
+    @unittest.skipIf(hnswlib is None, "hnswlib is not installed (poetry install --extras ann)")
+    def test_hnsw_mode_agrees_on_the_nearest_neighbour(self):
+        index = VectorIndex(self.path, mode="hnsw")
+        results = index.query(self.vectors[9], 3, {"is_person": True})
+        self.assertTrue(all(r["metadata"]["is_person"] for r in results))
+        self.assertEqual(results[0]["id"], self.index.query(self.vectors[9], 1, {"is_person": True})[0]["id"])
+
+
+class MatchesFilterTest(unittest.TestCase):
+    def test_eq_and_bare_values(self):
+        metadata = {"title": "Ada Lovelace", "is_person": True}
+        self.assertTrue(matches_filter(metadata, {"is_person": {"$eq": True}}))
+        self.assertTrue(matches_filter(metadata, {"is_person": True, "title": "Ada Lovelace"}))
+        self.assertFalse(matches_filter(metadata, {"is_person": {"$eq": False}}))
+        self.assertFalse(matches_filter(metadata, {"born": 1815}))
+        self.assertTrue(matches_filter(metadata, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import asyncio
+import tempfile
+import unittest
+
+from app.wiki_store import WikiPageStore
+
+
+def page(title, version=0):
+    return {"title": title, "categories": [], "sections": [{"title": "Intro", "text": f"{title} v{version}"}]}
+
+
+def stored(title, version=0):
+    return {**page(title, version), "requested_title": title}
+
+
+class WikiPageStoreTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = WikiPageStore(self.dir.name, loader=page)
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    async def test_miss_downloads_and_stores(self):
+        self.assertEqual(await self.store.get("Ada Lovelace"), page("Ada Lovelace"))
+        self.assertEqual(await self.store.get("Ada Lovelace"), stored("Ada Lovelace"))
+        self.assertEqual((self.store.stats["misses"], self.store.stats["hits"]), (1, 1))
+
+        reopened = WikiPageStore(self.dir.name, loader=page)
+        try:
+            self.assertEqual(reopened.lookup("Ada Lovelace")[0], stored("Ada Lovelace"))
+        finally:
+            reopened.close()
+
+    async def test_compaction_keeps_latest_records(self):
+        for version in range(3):
+            self.store.put("Ada Lovelace", page("Ada Lovelace", version))
+        self.assertGreater(self.store.compact(), 0)
+        self.assertEqual(self.store.lookup("Ada Lovelace")[0], stored("Ada Lovelace", 2))
+
+    async def test_reads_during_compaction(self):
+        titles = [f"Page {i}" for i in range(50)]
+        for title in titles:
+            for version in range(3):
+                self.store.put(title, page(title, version))
+
+        # the lookups run in worker threads while another thread swaps the files under them
+        compaction = asyncio.create_task(asyncio.to_thread(lambda: [self.store.compact() for _ in range(20)]))
+        for _ in range(10):
+            pages = await asyncio.gather(*[self.store.get(title) for title in titles])
+            self.assertEqual(pages, [stored(title, 2) for title in titles])
+        await compaction
+        self.assertEqual(self.store.stats["misses"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()